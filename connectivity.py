@@ -0,0 +1,114 @@
+from pathfinding import STEPS
+
+# cells a blocked tile's neighbours may search through to find each other again, past it the
+# regions are labelled again from scratch on the next question
+LOCAL_CHECK_CELLS = 256
+
+
+class ConnectivityRegions(object):
+    # walkable cells of a location grouped into connected regions with union-find, two cells are
+    # reachable from each other when they have the same root, a tile becoming walkable joins the
+    # regions around it, a tile getting blocked only costs a relabel when it really split a region
+
+    def __init__(self, location):
+        self.location = location
+        self.height = location.height
+        self.width = location.width
+        # parent index of every cell, -1 for cells not walkable since the last relabel
+        self.parent = []
+        # blocked cells left in the tree since the last relabel
+        self.blocked = set()
+        self.stale = True
+        self.rebuilds = 0
+        location.tile_listeners.append(self.on_tile_change)
+
+    def is_walkable(self, y, x):
+        return 0 <= y < self.height and 0 <= x < self.width and self.location.is_walkable(y, x)
+
+    def find(self, index):
+        parent = self.parent
+        while parent[index] != index:
+            # path halving, every visited cell skips one level
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    def union(self, first, second):
+        first = self.find(first)
+        second = self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+    def rebuild(self):
+        width = self.width
+        self.parent = parent = [-1] * (self.height * width)
+        self.blocked = set()
+        for y in range(self.height):
+            for x in range(width):
+                if not self.is_walkable(y, x):
+                    continue
+                index = y * width + x
+                parent[index] = index
+                if x > 0 and parent[index - 1] != -1:
+                    self.union(index - 1, index)
+                if y > 0 and parent[index - width] != -1:
+                    self.union(index - width, index)
+        self.stale = False
+        self.rebuilds += 1
+
+    def region_of(self, y, x):
+        if self.stale:
+            self.rebuild()
+        if not self.is_walkable(y, x):
+            return None
+        return self.find(y * self.width + x)
+
+    def reachable(self, start, goals):
+        # True if any of the goal cells can be walked to from start
+        region = self.region_of(*start)
+        return region is not None and any(self.region_of(*goal) == region for goal in goals)
+
+    def on_tile_change(self, y, x, tile):
+        if self.stale:
+            return
+        index = y * self.width + x
+        # set_tile has already updated the location when listeners are called
+        if self.location.is_walkable(y, x):
+            neighbours = [(y + dy) * self.width + x + dx for dy, dx in STEPS if self.is_walkable(y + dy, x + dx)]
+            if self.parent[index] == -1:
+                self.parent[index] = index
+            elif index in self.blocked:
+                self.blocked.discard(index)
+                # it still has the root it had before it was blocked, that only holds when a
+                # neighbour it opens up to is in the same region, it can not leave the tree
+                root = self.find(index)
+                if not any(self.find(neighbour) == root for neighbour in neighbours):
+                    self.stale = True
+                    return
+            for neighbour in neighbours:
+                self.union(index, neighbour)
+        elif self.parent[index] != -1:
+            # other cells may go through it to their root, so it stays in the tree, region_of
+            # does not answer for it while it is blocked
+            self.blocked.add(index)
+            neighbours = [(y + dy, x + dx) for dy, dx in STEPS if self.is_walkable(y + dy, x + dx)]
+            if len(neighbours) > 1 and not self.still_connected(neighbours):
+                self.stale = True
+
+    def still_connected(self, cells):
+        # small search from the first cell reaching all others without the changed tile
+        wanted = set(cells[1:])
+        seen = {cells[0]}
+        frontier = [cells[0]]
+        for y, x in frontier:
+            if len(seen) >= LOCAL_CHECK_CELLS:
+                break
+            for dy, dx in STEPS:
+                cell = (y + dy, x + dx)
+                if cell not in seen and self.is_walkable(*cell):
+                    seen.add(cell)
+                    wanted.discard(cell)
+                    if not wanted:
+                        return True
+                    frontier.append(cell)
+        return False
@@ -0,0 +1,171 @@
+import curses
+import locale
+
+from key_events import KeyEventBuffer
+
+# keys curses gives as numbers, translated to the names tkinter gives them
+CURSES_KEYS = {curses.KEY_UP: 'Up', curses.KEY_DOWN: 'Down', curses.KEY_LEFT: 'Left', curses.KEY_RIGHT: 'Right',
+               curses.KEY_ENTER: 'Return', 10: 'Return', 13: 'Return', curses.KEY_BACKSPACE: 'BackSpace',
+               8: 'BackSpace', 127: 'BackSpace', 27: 'Escape'}
+# how many screens of map around the view are kept drawn in the pad
+PAD_SCREENS = 3
+# lines of messages kept under the hud
+MESSAGE_LINES = 3
+
+
+class CursesScreen(object):
+    # the map is drawn once into a curses pad bigger than the screen, after that only changed
+    # tiles and the moving dwarf, food and cursor are redrawn, scrolling just moves the pad
+    # offset, the hud has a window of its own and curses sends only what really changed
+
+    def __init__(self, key_handler_function, hud_lines_function):
+        # without it curses can not draw the tile characters
+        locale.setlocale(locale.LC_ALL, '')
+        self.key_handler_function = key_handler_function
+        self.hud_lines_function = hud_lines_function
+        # keys pressed since the game last took them
+        self.keys = KeyEventBuffer()
+        self.stdscr = curses.initscr()
+        curses.noecho()
+        curses.cbreak()
+        self.stdscr.keypad(True)
+        self.stdscr.nodelay(True)
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        self.location = None
+        self.pad = None
+        self.hud_window = None
+        # map position of the pad's top left corner and its size in tiles
+        self.pad_top = 0
+        self.pad_left = 0
+        self.pad_height = 0
+        self.pad_width = 0
+        # tiles changed since the last frame
+        self.dirty = set()
+        # position -> character of the dwarf, food and cursor drawn last frame
+        self.overlays = {}
+        self.messages = []
+        self.closed = False
+
+    def update(self):
+        while True:
+            key = self.stdscr.getch()
+            if key == -1:
+                return
+            if key in CURSES_KEYS:
+                self.key_handler_function(self, CURSES_KEYS[key])
+            elif 0 <= key < 0x110000:
+                self.key_handler_function(self, chr(key))
+
+    def show_text(self, lines):
+        self.stdscr.erase()
+        max_y, max_x = self.stdscr.getmaxyx()
+        y = 0
+        for line in lines:
+            # long lines wrap over several screen lines
+            for start in range(0, max(len(line), 1), max_x):
+                if y < max_y - 1:
+                    self.stdscr.addstr(y, 0, line[start:start + max_x])
+                y += 1
+        self.stdscr.refresh()
+
+    def show_message(self, text):
+        self.messages = (self.messages + [text])[-MESSAGE_LINES:]
+        if self.hud_window is not None:
+            self.draw_messages()
+            curses.doupdate()
+
+    def start(self, world, location):
+        if self.location is not None:
+            # another location is shown from now on
+            self.location.tile_listeners.remove(self.on_tile_change)
+            if self.location.fog is not None:
+                self.location.fog.reveal_listeners.remove(self.on_tile_change)
+            self.dirty.clear()
+        self.location = location
+        location.tile_listeners.append(self.on_tile_change)
+        if location.fog is not None:
+            location.fog.reveal_listeners.append(self.on_tile_change)
+        self.stdscr.erase()
+        self.stdscr.noutrefresh()
+        max_y, max_x = self.stdscr.getmaxyx()
+        self.hud_window = curses.newwin(max(max_y - location.view_height, 1), max_x,
+                                        min(location.view_height, max_y - 1), 0)
+        self.pad_height = min(location.height, location.view_height * PAD_SCREENS)
+        self.pad_width = min(location.width, location.view_width * PAD_SCREENS)
+        # one more line, curses can not write the very last cell of a pad without an error
+        self.pad = curses.newpad(self.pad_height + 1, self.pad_width * 2 + 1)
+        self.place_pad()
+
+    def place_pad(self):
+        # center the pad on the view and draw all of it, only needed when the view left the pad
+        location = self.location
+        self.pad_top = max(0, min(location.view_top - (self.pad_height - location.view_height) // 2,
+                                  location.height - self.pad_height))
+        self.pad_left = max(0, min(location.view_left - (self.pad_width - location.view_width) // 2,
+                                   location.width - self.pad_width))
+        for y in range(self.pad_top, self.pad_top + self.pad_height):
+            row = ' '.join(location.shown_tile(y, x) for x in range(self.pad_left, self.pad_left + self.pad_width))
+            self.pad.addstr(y - self.pad_top, 0, row)
+        self.dirty.clear()
+        self.overlays = {}
+
+    def on_tile_change(self, y, x, tile):
+        self.dirty.add((y, x))
+
+    def in_pad(self, y, x):
+        return self.pad_top <= y < self.pad_top + self.pad_height and \
+            self.pad_left <= x < self.pad_left + self.pad_width
+
+    def put(self, y, x, character):
+        if self.in_pad(y, x):
+            self.pad.addstr(y - self.pad_top, (x - self.pad_left) * 2, character)
+
+    def draw(self, world, location, dwarf, food, cursor):
+        location.scroll_view(cursor.y_coord, cursor.x_coord)
+        if not (self.in_pad(location.view_top, location.view_left) and
+                self.in_pad(location.view_top + location.view_height - 1,
+                            location.view_left + location.view_width - 1)):
+            self.place_pad()
+        # put back the tiles under last frame's dwarf, food and cursor, then the changed ones
+        for y, x in list(self.overlays) + list(self.dirty):
+            self.put(y, x, location.shown_tile(y, x))
+        self.dirty.clear()
+        self.overlays = {}
+        for thing in (food, dwarf, cursor):
+            if thing is food and location.shown_tile(food.y_coord, food.x_coord) == ' ':
+                continue
+            self.overlays[(thing.y_coord, thing.x_coord)] = thing.representation
+            self.put(thing.y_coord, thing.x_coord, thing.representation)
+        max_y, max_x = self.stdscr.getmaxyx()
+        self.pad.noutrefresh(location.view_top - self.pad_top, (location.view_left - self.pad_left) * 2,
+                             0, 0, min(location.view_height, max_y) - 1, min(location.view_width * 2, max_x) - 1)
+        self.hud_window.erase()
+        hud_height, hud_width = self.hud_window.getmaxyx()
+        # on a short terminal the messages may take the whole hud window
+        lines = self.hud_lines_function(world, location, dwarf, food, cursor)[:max(0, hud_height - MESSAGE_LINES)]
+        for y, line in enumerate(lines):
+            self.hud_window.addstr(y, 0, line[:hud_width - 1])
+        self.draw_messages()
+        curses.doupdate()
+
+    def draw_messages(self):
+        hud_height, hud_width = self.hud_window.getmaxyx()
+        for i, message in enumerate(self.messages):
+            y = hud_height - MESSAGE_LINES + i
+            if y >= 0:
+                self.hud_window.move(y, 0)
+                self.hud_window.clrtoeol()
+                self.hud_window.addstr(y, 0, message[:hud_width - 1])
+        self.hud_window.noutrefresh()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.stdscr.keypad(False)
+        curses.nocbreak()
+        curses.echo()
+        curses.endwin()
@@ -0,0 +1,107 @@
+from collections import deque
+from itertools import chain
+
+from tiles import glyphs_where
+
+# job name -> tiles the job can be done on, from the flags in the tile registry
+JOB_TILES = {'chop': frozenset(glyphs_where('choppable')),
+             'mine': frozenset(glyphs_where('minable')),
+             'wall': frozenset(glyphs_where('buildable_on'))}
+
+
+class Designation(object):
+    def __init__(self, number, job, location, top, left, bottom, right):
+        self.number = number
+        self.job = job
+        self.top = top
+        self.left = left
+        self.bottom = bottom
+        self.right = right
+        self.cancelled = False
+        # tiles handed out but given back unfinished
+        self.returned = []
+        # tiles are only looked at when a dwarf asks for work, so a huge area costs nothing up front
+        self.candidates = self.find_candidates(location)
+
+    def find_candidates(self, location):
+        tiles = JOB_TILES[self.job]
+        if all(tile in location.tile_index.buckets for tile in tiles):
+            index = location.tile_index
+            return chain.from_iterable(index.within_rect(tile, self.top, self.left, self.bottom, self.right)
+                                       for tile in tiles)
+        return ((y, x) for y in range(self.top, self.bottom + 1) for x in range(self.left, self.right + 1))
+
+    def covers(self, y, x):
+        return self.top <= y <= self.bottom and self.left <= x <= self.right
+
+    def size(self):
+        return (self.bottom - self.top + 1) * (self.right - self.left + 1)
+
+
+class DesignationBoard(object):
+    # rectangles marked for chopping, mining or building walls, jobs are handed out one by one
+
+    def __init__(self, location):
+        self.location = location
+        self.active = {}
+        self.queue = deque()
+        self.last_number = 0
+
+    def designate(self, job, corner_y, corner_x, y, x):
+        self.last_number += 1
+        designation = Designation(self.last_number, job, self.location,
+                                  min(corner_y, y), min(corner_x, x), max(corner_y, y), max(corner_x, x))
+        self.active[designation.number] = designation
+        self.queue.append(designation)
+        return designation
+
+    def cancel(self, designation):
+        # jobs of a cancelled designation are never generated, queue skips it lazily
+        designation.cancelled = True
+        self.active.pop(designation.number, None)
+
+    def release(self, designation, y, x):
+        if not designation.cancelled:
+            designation.returned.append((y, x))
+            if designation.number not in self.active:
+                self.active[designation.number] = designation
+                self.queue.append(designation)
+
+    def state(self):
+        # what is needed to set the board up again, the tiles left are found again from the location
+        return self.last_number, [(d.number, d.job, d.top, d.left, d.bottom, d.right) for d in self.active.values()]
+
+    def restore(self, state):
+        self.last_number, rectangles = state
+        self.active = {}
+        self.queue = deque()
+        for number, job, top, left, bottom, right in rectangles:
+            designation = Designation(number, job, self.location, top, left, bottom, right)
+            self.active[number] = designation
+            self.queue.append(designation)
+
+    def has_job(self, job):
+        return any(designation.job == job for designation in self.active.values())
+
+    def designation_at(self, y, x):
+        for designation in reversed(list(self.active.values())):
+            if designation.covers(y, x):
+                return designation
+        return None
+
+    def next_job(self):
+        # (designation, y, x) of the next tile still matching its job, or None when there is no work
+        while self.queue:
+            designation = self.queue[0]
+            if not designation.cancelled:
+                tiles = JOB_TILES[designation.job]
+                while designation.returned:
+                    y, x = designation.returned.pop()
+                    if self.location.get_tile(y, x) in tiles:
+                        return designation, y, x
+                for y, x in designation.candidates:
+                    if self.location.get_tile(y, x) in tiles:
+                        return designation, y, x
+                self.active.pop(designation.number, None)
+            self.queue.popleft()
+        return None
@@ -0,0 +1,93 @@
+# ticks between two runs of the environment rules
+ENVIRONMENT_INTERVAL = 20
+# chance per run and per neighbouring tree that an empty tile gets a sapling
+SPROUT_CHANCE = 0.002
+# chance per run that a sapling grows into a tree
+GROW_CHANCE = 0.05
+# chance per run that an empty mined out tile fills with water seeping from the rock
+SEEP_CHANCE = 0.001
+# chance per run and per neighbouring water tile that water flows into an empty mined out tile
+FLOW_CHANCE = 0.02
+
+EMPTY, ROCK, TREE, WALL, BED, SAPLING, WATER = range(7)
+
+
+class EnvironmentLayer(object):
+    # cellular automaton rules run over the whole location every few ticks, trees spread saplings
+    # to empty tiles around them and saplings grow into trees, optionally water seeps into mined
+    # out tunnels, the rules are NumPy operations on a copy of the grid kept up to date by set_tile
+
+    def __init__(self, location, sapling, water=None, seed=None, interval=ENVIRONMENT_INTERVAL):
+        # NumPy is only needed when the environment is switched on
+        import numpy
+        self.numpy = numpy
+        self.location = location
+        self.interval = interval
+        self.rng = numpy.random.default_rng(seed)
+        self.tiles = {location.empty: EMPTY, location.rock: ROCK, location.tree: TREE, location.wall: WALL,
+                      location.bed: BED, sapling: SAPLING}
+        if water is not None:
+            self.tiles[water] = WATER
+        self.glyphs = {code: tile for tile, code in self.tiles.items()}
+        self.water = water is not None
+        self.codes = numpy.array([[self.tiles.get(location.get_tile(y, x), EMPTY) for x in range(location.width)]
+                                  for y in range(location.height)], dtype=numpy.uint8)
+        # tiles a rock was mined out of, only those fill with water
+        self.mined = numpy.zeros(self.codes.shape, dtype=bool)
+        # set while the layer writes its own changes, they are already in codes
+        self.applying = False
+        location.tile_listeners.append(self.on_tile_change)
+
+    def on_tile_change(self, y, x, tile):
+        if self.applying:
+            return
+        if self.codes[y, x] == ROCK and tile == self.location.empty:
+            self.mined[y, x] = True
+        self.codes[y, x] = self.tiles.get(tile, EMPTY)
+
+    def neighbours(self, mask, diagonal=True):
+        # number of True cells around every cell, summed from shifted views of a padded copy
+        numpy = self.numpy
+        padded = numpy.pad(mask.astype(numpy.uint8), 1)
+        height, width = mask.shape
+        offsets = [(0, 1), (1, 0), (1, 2), (2, 1)]
+        if diagonal:
+            offsets += [(0, 0), (0, 2), (2, 0), (2, 2)]
+        count = numpy.zeros(mask.shape, dtype=numpy.uint8)
+        for dy, dx in offsets:
+            count += padded[dy:dy + height, dx:dx + width]
+        return count
+
+    def tick(self, tick, occupied=()):
+        # occupied are (y, x) of dwarfs and food, nothing grows or flows onto them
+        if tick % self.interval:
+            return []
+        return self.step(occupied)
+
+    def step(self, occupied=()):
+        codes = self.codes
+        chances = self.rng.random(codes.shape)
+        empty = codes == EMPTY
+        for y, x in occupied:
+            empty[y, x] = False
+        new = codes.copy()
+        trees = self.neighbours(codes == TREE)
+        new[empty & (chances < trees * SPROUT_CHANCE)] = SAPLING
+        saplings = codes == SAPLING
+        for y, x in occupied:
+            saplings[y, x] = False
+        new[saplings & (chances < GROW_CHANCE)] = TREE
+        if self.water:
+            tunnels = empty & self.mined
+            flow = self.neighbours(codes == WATER, diagonal=False) * FLOW_CHANCE
+            new[tunnels & ((chances < SEEP_CHANCE) | (chances < flow))] = WATER
+        changed = self.numpy.nonzero(new != codes)
+        self.codes = new
+        # only the few changed tiles go through set_tile, so indexes and caches see them
+        self.applying = True
+        try:
+            for y, x in zip(changed[0].tolist(), changed[1].tolist()):
+                self.location.set_tile(y, x, self.glyphs[new[y, x]])
+        finally:
+            self.applying = False
+        return list(zip(changed[0].tolist(), changed[1].tolist()))
@@ -0,0 +1,136 @@
+# how far a dwarf sees
+FOV_RADIUS = 8
+# multipliers turning the first octant into each of the eight around the viewer
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+
+def shadowcast(is_opaque, origin, radius, bounds):
+    # cells seen from origin, recursive shadowcasting, bounds are (min_y, min_x, max_y, max_x)
+    # inclusive like in astar, cells outside of them block the view
+    visible = {origin}
+    for multipliers in OCTANTS:
+        cast_light(is_opaque, origin, radius, bounds, multipliers, 1, 1.0, 0.0, visible)
+    return visible
+
+
+def cast_light(is_opaque, origin, radius, bounds, multipliers, row, start, end, visible):
+    # lights one octant row by row between the start and end slopes, a blocking cell splits
+    # the lit part and the part behind it is done by a recursive call
+    if start < end:
+        return
+    oy, ox = origin
+    xx, xy, yx, yy = multipliers
+    min_y, min_x, max_y, max_x = bounds
+    radius_squared = radius * radius
+    new_start = start
+    for distance in range(row, radius + 1):
+        dx, dy = -distance - 1, -distance
+        blocked = False
+        while dx <= 0:
+            dx += 1
+            x = ox + dx * xx + dy * xy
+            y = oy + dx * yx + dy * yy
+            left_slope = (dx - 0.5) / (dy + 0.5)
+            right_slope = (dx + 0.5) / (dy - 0.5)
+            if start < right_slope:
+                continue
+            if end > left_slope:
+                break
+            inside = min_y <= y <= max_y and min_x <= x <= max_x
+            if inside and dx * dx + dy * dy <= radius_squared:
+                visible.add((y, x))
+            opaque = not inside or is_opaque(y, x)
+            if blocked:
+                if opaque:
+                    new_start = right_slope
+                else:
+                    blocked = False
+                    start = new_start
+            elif opaque and distance < radius:
+                blocked = True
+                cast_light(is_opaque, origin, radius, bounds, multipliers, distance + 1, start, left_slope, visible)
+                new_start = right_slope
+        if blocked:
+            break
+
+
+class FogOfWar(object):
+    # tiles seen by the dwarfs of a location, every dwarf keeps the cells it sees until it moves
+    # or a tile within its sight changes, a dwarf only has to be told when it moved, and refresh()
+    # once a tick looks again for the dwarfs that saw a change, so dwarfs standing still cost nothing
+
+    def __init__(self, location, opaque_tiles, radius=FOV_RADIUS):
+        self.location = location
+        self.opaque_tiles = opaque_tiles
+        self.radius = radius
+        self.bounds = (0, 0, location.height - 1, location.width - 1)
+        # cells seen at least once
+        self.explored = set()
+        # cell -> number of dwarfs seeing it now
+        self.visible = {}
+        # dwarf -> (where it stood, cells it saw from there)
+        self.views = {}
+        # (y // radius, x // radius) of where dwarfs stand -> those dwarfs, to find who saw a change
+        self.viewers = {}
+        self.stale = set()
+        # functions called with (y, x, tile) for every newly explored cell
+        self.reveal_listeners = []
+        location.tile_listeners.append(self.on_tile_change)
+
+    def is_opaque(self, y, x):
+        return self.location.get_tile(y, x) in self.opaque_tiles
+
+    def is_explored(self, y, x):
+        return (y, x) in self.explored
+
+    def is_visible(self, y, x):
+        return (y, x) in self.visible
+
+    def bucket_of(self, y, x):
+        return y // self.radius, x // self.radius
+
+    def update(self, agent, y, x):
+        # called when the dwarf may have moved, it only looks again if it did
+        view = self.views.get(agent)
+        if view is not None and view[0] == (y, x):
+            return
+        self.look(agent, y, x)
+
+    def refresh(self):
+        for agent in list(self.stale):
+            self.look(agent, *self.views[agent][0])
+
+    def look(self, agent, y, x):
+        self.stale.discard(agent)
+        self.forget(agent)
+        cells = shadowcast(self.is_opaque, (y, x), self.radius, self.bounds)
+        self.views[agent] = ((y, x), cells)
+        self.viewers.setdefault(self.bucket_of(y, x), set()).add(agent)
+        for cell in cells:
+            self.visible[cell] = self.visible.get(cell, 0) + 1
+            if cell not in self.explored:
+                self.explored.add(cell)
+                for listener in self.reveal_listeners:
+                    listener(cell[0], cell[1], self.location.get_tile(*cell))
+
+    def forget(self, agent):
+        view = self.views.pop(agent, None)
+        if view is None:
+            return
+        bucket = self.bucket_of(*view[0])
+        self.viewers[bucket].discard(agent)
+        if not self.viewers[bucket]:
+            del self.viewers[bucket]
+        for cell in view[1]:
+            self.visible[cell] -= 1
+            if not self.visible[cell]:
+                del self.visible[cell]
+
+    def on_tile_change(self, y, x, tile):
+        by, bx = self.bucket_of(y, x)
+        for bucket in ((by + dy, bx + dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1)):
+            for agent in self.viewers.get(bucket, ()):
+                origin = self.views[agent][0]
+                if max(abs(origin[0] - y), abs(origin[1] - x)) <= self.radius:
+                    self.stale.add(agent)
@@ -793,3 +793,25 @@ class Canvas(tkinter.Canvas):
         # this introduces a memory leak which can be fixed by overloading delete
         self._image_gb_protection[img_obj] = image
         return img_obj
+
+    def create_bitmap(self, x, y, width, height, **kwargs):
+        """
+        Creates a blank image of the specified size at the specified position on the canvas that can be drawn into
+        pixel by pixel.  Rows of pixels are set with the `put` method of the returned image, many rows at once in a
+        single call, which is much faster than one canvas object per pixel.
+
+        Args:
+            x: the x coordinate of the top-left corner of the image on the canvas
+            y: the y coordinate of the top-left corner of the image on the canvas
+            width: the width of the image in pixels
+            height: the height of the image in pixels
+            kwargs: other tkinter keyword args
+
+        Returns:
+            a tuple of the graphical image object and the `tkinter.PhotoImage` it displays.
+        """
+        image = tkinter.PhotoImage(master=self, width=width, height=height)
+        img_obj = super().create_image(x, y, anchor="nw", image=image, **kwargs)
+        # same as with images loaded from files, keep a reference so it is not garbage collected
+        self._image_gb_protection[img_obj] = image
+        return img_obj, image
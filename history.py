@@ -0,0 +1,115 @@
+import copy
+from collections import deque
+
+from reservations import ReservationTable
+
+# ticks between two snapshots
+SNAPSHOT_INTERVAL = 20
+# snapshots kept, older ones are dropped
+HISTORY_LENGTH = 256
+# what of the cursor belongs to the fortress, the rest is where the player is looking
+CURSOR_FIELDS = ['goal', 'goal_y_coord', 'goal_x_coord', 'goal_neighbourhood', 'goal_building', 'build_orders']
+
+
+class Snapshot(object):
+    def __init__(self, tick, time_of_the_day, night_or_day, rows, things, cursor, designations, bed):
+        self.tick = tick
+        self.time_of_the_day = time_of_the_day
+        self.night_or_day = night_or_day
+        # one tuple per row, shared with the snapshots before it while the row does not change
+        self.rows = rows
+        # [(dwarf or food, copy of its attributes)]
+        self.things = things
+        self.cursor = cursor
+        self.designations = designations
+        self.bed = bed
+
+
+class WorldHistory(object):
+    # copy-on-write snapshots of a finite location, a row is copied only when one of its tiles changed
+    # since the snapshot before, so a snapshot costs a pointer per row plus the changed rows,
+    # going back sets only the tiles that differ, through set_tile so every index follows
+
+    def __init__(self, world, location, things, cursor, interval=SNAPSHOT_INTERVAL, length=HISTORY_LENGTH):
+        self.world = world
+        self.location = location
+        # dwarfs and food, everything about them is kept
+        self.things = things
+        self.cursor = cursor
+        self.interval = interval
+        self.snapshots = deque(maxlen=length)
+        # rows as they were at the last snapshot and the ones changed since
+        self.rows = [tuple(location.row(y)) for y in range(location.height)]
+        self.dirty = set()
+        # set by a rewind until the next snapshot, pressing undo again goes further back
+        self.rewound = False
+        location.tile_listeners.append(self.on_tile_change)
+
+    def on_tile_change(self, y, x, tile):
+        self.dirty.add(y)
+
+    def tick(self, tick):
+        if tick % self.interval == 0:
+            self.take()
+
+    def take(self):
+        self.rewound = False
+        if self.dirty:
+            self.rows = list(self.rows)
+            for y in self.dirty:
+                self.rows[y] = tuple(self.location.row(y))
+            self.dirty.clear()
+        cursor = {name: copy.copy(getattr(self.cursor, name)) for name in CURSOR_FIELDS}
+        # designations are set up again on the way back, the one worked on is found by its number
+        designation = self.cursor.goal_designation
+        cursor['goal_designation'] = None if designation is None else designation.number
+        self.snapshots.append(Snapshot(
+            self.world.tick, self.world.time_of_the_day, self.world.is_it_night_or_day, self.rows,
+            [(thing, {name: copy.copy(value) for name, value in vars(thing).items()}) for thing in self.things],
+            cursor, self.location.designations.state(), (self.location.bed_y, self.location.bed_x)))
+
+    def rewind(self, steps=1):
+        # back by steps snapshots or to the oldest kept, the newer ones are dropped, the last one is
+        # the first step back when the world went on since it, returns the tick it went back to
+        # or None with nothing to go back to
+        if not self.snapshots:
+            return None
+        if self.snapshots[-1].tick != self.world.tick and not self.rewound:
+            steps -= 1
+        steps = min(steps, len(self.snapshots) - 1)
+        for _ in range(steps):
+            self.snapshots.pop()
+        self.restore(self.snapshots[-1])
+        self.rewound = True
+        return self.world.tick
+
+    def restore(self, snapshot):
+        location = self.location
+        changed = set(self.dirty)
+        changed.update(y for y, (now, then) in enumerate(zip(self.rows, snapshot.rows)) if now is not then)
+        for y in changed:
+            row = location.row(y)
+            for x, tile in enumerate(snapshot.rows[y]):
+                if row[x] != tile:
+                    location.set_tile(y, x, tile)
+        self.rows = snapshot.rows
+        self.dirty.clear()
+        self.world.tick = snapshot.tick
+        self.world.time_of_the_day = snapshot.time_of_the_day
+        self.world.is_it_night_or_day = snapshot.night_or_day
+        for thing, state in snapshot.things:
+            vars(thing).update({name: copy.copy(value) for name, value in state.items()})
+        location.designations.restore(snapshot.designations)
+        for name, value in snapshot.cursor.items():
+            setattr(self.cursor, name, copy.copy(value))
+        if self.cursor.goal_designation is not None:
+            self.cursor.goal_designation = location.designations.active.get(self.cursor.goal_designation)
+            if self.cursor.goal_designation is None:
+                self.cursor.goal = None
+        location.bed_y, location.bed_x = snapshot.bed
+        # nobody walks the plans made in the future
+        location.reservations = ReservationTable()
+        for thing in self.things:
+            if hasattr(thing, 'steps'):
+                thing.steps = []
+                thing.path = []
@@ -0,0 +1,66 @@
+import time
+from collections import deque
+
+# keys kept between two ticks, more are dropped and counted
+KEY_BUFFER_SIZE = 64
+# latencies of the last keys kept for the input report
+LATENCY_SAMPLES = 256
+# seconds between two looks at the input while the game waits for the next tick
+POLL_INTERVAL = 0.01
+
+
+class KeyEventBuffer(object):
+    # every key pressed between two ticks in order with the time it came in, the game takes them
+    # all at the start of a tick, how long keys waited and how many did not fit is kept
+
+    def __init__(self, size=KEY_BUFFER_SIZE, clock=time.monotonic):
+        self.size = size
+        self.clock = clock
+        # (time, key)
+        self.events = deque()
+        self.received = 0
+        self.dropped = 0
+        # seconds between a key coming in and the tick taking it
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def push(self, key):
+        if len(self.events) >= self.size:
+            self.dropped += 1
+            return
+        self.received += 1
+        self.events.append((self.clock(), key))
+
+    def drain(self, coalesce=()):
+        # [(key, times)] of all waiting keys, runs of the same key in coalesce come as one entry
+        now = self.clock()
+        keys = []
+        while self.events:
+            pressed, key = self.events.popleft()
+            self.latencies.append(now - pressed)
+            if keys and key in coalesce and keys[-1][0] == key:
+                keys[-1] = (key, keys[-1][1] + 1)
+            else:
+                keys.append((key, 1))
+        return keys
+
+    def clear(self):
+        self.events.clear()
+
+    def report(self):
+        if not self.latencies:
+            return "input: {} keys, {} dropped".format(self.received, self.dropped)
+        return "input: {} keys, latency mean {:.1f} ms max {:.1f} ms, {} dropped".format(
+            self.received, 1000 * sum(self.latencies) / len(self.latencies), 1000 * max(self.latencies),
+            self.dropped)
+
+
+def sleep_reading_keys(update, seconds, clock=time.monotonic, sleep=time.sleep):
+    # sleeps like time.sleep while calling update every POLL_INTERVAL, so keys get the time
+    # they were pressed at instead of the time the next tick looked
+    end = clock() + seconds
+    while True:
+        update()
+        left = end - clock()
+        if left <= 0:
+            return
+        sleep(min(left, POLL_INTERVAL))
@@ -1,8 +1,27 @@
-from graphics import Canvas
 import time
+# taken before anything else is imported, start up is measured from here
+STARTED = time.perf_counter()
+from pathfinding import HierarchicalPathfinder, PathCache, PathRepair, ENDLESS_NODE_BUDGET
+from spatial_index import TileIndex
+from designations import DesignationBoard
+from reservations import ReservationTable, COOPERATIVE_WINDOW
+from fov import FogOfWar
+from connectivity import ConnectivityRegions
+from terrain import TerrainGenerator, CHUNK_SIZE, MAX_LOADED_CHUNKS
+from tick_regulator import TickRegulator
+from key_events import KeyEventBuffer, sleep_reading_keys, POLL_INTERVAL
+from tiles import PassabilityLayer, glyphs_where, tile_type
+from history import WorldHistory, SNAPSHOT_INTERVAL
+from sites import Site, LOD_INTERVAL
+from collections import OrderedDict, deque
+import argparse
 import random
+import sys
 import os
 
+# seconds since STARTED at which each start up step was done
+startup_times = {'imports': time.perf_counter() - STARTED}
+
 
 def clear_console():
     # for command line
@@ -12,46 +31,61 @@ def clear_console():
     #     print()
 
 
-def greeting_screen(world, key_event_canvas):
-    print("Karel Fortress".center(2 * world.world_width))
-    print("This is dwarf: A".center(2 * world.world_width))
-    print("It ain't much but has an honest hat.".center(2 * world.world_width))
-    print()
-    print("It is Dwarf Fortress like game, you are controlling a cursor ☼. You can point at a tree to order dwarf to"
-          " chop it for wood, point at rock in order for it to be mined."
-          " You can build things on the ground represented by dots")
-    print()
-    print()
-    print("Dwarf goes to heart representing food when it's hungry(fullness below 50)"
-          " and goes to bed at 22 and wakes up at 6")
-    print()
-    print()
-    print()
-    print("Arrows control a cursor ☼, it starts at top left corner.".center(2 * world.world_width))
-    print()
-    print("By pointing the cursor somewhere and pressing key you can order a dwarf to:")
-    print()
-    print(" c - chop tree ♠".center(2 * world.world_width))
-    print("m - mine rock ■".center(2 * world.world_width))
-    print("b - build wooden wall ░ or bed B".center(2 * world.world_width))
-    print("g - go for a walk".center(2 * world.world_width))
-    print("Additionally r - rescue(terminates current task), 1/2/3 - game speed".center(2 * world.world_width))
-    print()
-    print()
-    print("press enter to continue")
-    key = ''
-    while key != 'enter':
+def greeting_lines(world):
+    return ["Karel Fortress".center(2 * world.view_width),
+            "This is dwarf: A".center(2 * world.view_width),
+            "It ain't much but has an honest hat.".center(2 * world.view_width),
+            "",
+            "It is Dwarf Fortress like game, you are controlling a cursor ☼. You can point at a tree to order dwarf to"
+            " chop it for wood, point at rock in order for it to be mined."
+            " You can build things on the ground represented by dots",
+            "",
+            "",
+            "Dwarf goes to heart representing food when it's hungry(fullness below 50)"
+            " and goes to bed at 22 and wakes up at 6",
+            "",
+            "",
+            "",
+            "Arrows control a cursor ☼, it starts at top left corner.".center(2 * world.view_width),
+            "",
+            "By pointing the cursor somewhere and pressing key you can order a dwarf to:",
+            "",
+            " c - chop tree ♠".center(2 * world.view_width),
+            "m - mine rock ■".center(2 * world.view_width),
+            "b - build wooden wall ░ or bed B".center(2 * world.view_width),
+            "g - go for a walk".center(2 * world.view_width),
+            "a - let it chop and mine on its own".center(2 * world.view_width),
+            "d - mark a corner, then c/m/w - designate a rectangle for chop/mine/walls".center(2 * world.view_width),
+            "Additionally r - rescue(terminates current task), 1/2/3/4 - game speed(4 turbo)".center(2 * world.view_width),
+            "",
+            "",
+            "press enter to continue"]
+
+
+def greeting_screen(world, key_event_canvas, screen):
+    screen.show_text(greeting_lines(world))
+    startup_times.setdefault('first frame', time.perf_counter() - STARTED)
+    while True:
         key_event_canvas.update()
-        key = key_event_canvas.stored_key
-        key_event_canvas.reset_stored_key()
+        if any(key == 'enter' for key, _ in key_event_canvas.keys.drain()):
+            break
+        time.sleep(POLL_INTERVAL)
+
+
+def report_startup():
+    print("start up:", ", ".join("{} {:.1f} ms".format(step, seconds * 1000)
+                                 for step, seconds in startup_times.items()))
 
 
 class KeyEventCanvas:
     def __init__(self, key_handler_function):
+        # tkinter is slow to import and needs a display, only load it when this input is used
+        from graphics import Canvas
         self.canvas = Canvas()
         self.canvas.bind("<Key>", self.on_key_press)
         self.key_handler_function = key_handler_function
-        self.stored_key = None
+        # keys pressed since the game last took them
+        self.keys = KeyEventBuffer()
 
     def on_key_press(self, event):
         key = event.keysym
@@ -60,13 +94,23 @@ class KeyEventCanvas:
     def update(self):
         self.canvas.update()
 
-    def reset_stored_key(self):
-        self.stored_key = None
-
     def mainloop(self):
         # IDK if necessary
         self.canvas.mainloop()
 
+    def close(self):
+        self.canvas.main_window.destroy()
+
+
+def create_input(kind, key_handler_function):
+    # auto picks the terminal whenever there is one, it starts much faster than a tkinter window
+    if kind == 'auto':
+        kind = 'terminal' if os.name != 'nt' and sys.stdin.isatty() else 'tk'
+    if kind == 'terminal':
+        from terminal_input import TerminalInput
+        return TerminalInput(key_handler_function)
+    return KeyEventCanvas(key_handler_function)
+
 
 def process_key(key_event_canvas, key):
     if key == 'Left':
@@ -79,29 +123,81 @@ def process_key(key_event_canvas, key):
         key = 'down'
     elif key == 'Return':
         key = 'enter'
-    key_event_canvas.stored_key = key
+    key_event_canvas.keys.push(key)
 
 
 class World(object):
-    speed_modes = [0, 1, 0.25, 0.1]
-    speed_modes_names = ['placeholder', 'slow', 'normal', 'fast']
-    allowed_to_step_on = ['☼', '♥', '.', 'B']
+    # seconds per tick, turbo runs as fast as the computer can
+    speed_modes = [0, 1, 0.25, 0.1, 0]
+    speed_modes_names = ['placeholder', 'slow', 'normal', 'fast', 'turbo']
     list_of_allowed_buildings = ['b', 'w', 'bed', 'wall']
+    # size of a world generated chunk by chunk, big enough to never walk to its end
+    unbounded_size = 2 ** 20
 
-    def __init__(self, name):
+    def __init__(self, name, width=40, height=15):
         self.name = name
-        self.world_width = 40
+        self.world_width = width
         self.max_world_x = self.world_width - 1
         self.middle_x = self.max_world_x // 2
-        self.world_height = 15
+        self.world_height = height
         self.max_world_y = self.world_height - 1
         self.middle_y = self.max_world_y // 2
+        # part of the map shown on the screen
+        self.view_width = min(self.world_width, 40)
+        self.view_height = min(self.world_height, 15)
         self.is_it_night_or_day = 'day'
         self.time_of_the_day = 12.0
+        # ticks since the start, dwarfs reserve tiles by it
+        self.tick = 0
         self.speed = self.speed_modes[2]
         self.speed_name = self.speed_modes_names[2]
+        self.clock = TickRegulator(self.speed)
+        # idle dwarf chops and mines on its own
+        self.auto_work = False
+        # name -> Site, only the focused one is simulated tick by tick, the others wait in
+        # unfocused for their turn to catch up
+        self.sites = OrderedDict()
+        self.focus = None
+        self.unfocused = deque()
+        # WorldHistory with --history, shown on the hud
+        self.history = None
+
+    def add_site(self, site):
+        self.sites[site.name] = site
+        if self.focus is None:
+            self.focus = site.name
+        else:
+            site.unfocus(self)
+            self.unfocused.append(site)
+
+    def focused_site(self):
+        return self.sites[self.focus]
+
+    def focus_next(self):
+        # the next site in order gets the focus, the one left goes on in totals
+        if not self.unfocused:
+            return self.focused_site()
+        names = list(self.sites)
+        site = self.sites[names[(names.index(self.focus) + 1) % len(names)]]
+        left = self.focused_site()
+        left.unfocus(self)
+        self.unfocused.remove(site)
+        self.unfocused.append(left)
+        site.focus(self)
+        self.focus = site.name
+        return site
+
+    def catch_up_sites(self):
+        # one unfocused site a tick looks if it is due, so the cost does not grow with the sites
+        if not self.unfocused:
+            return
+        site = self.unfocused[0]
+        self.unfocused.rotate(-1)
+        if self.tick - site.summary.tick >= LOD_INTERVAL:
+            site.catch_up(self.tick)
 
     def world_tick(self):
+        self.tick += 1
         self.time_of_the_day += 0.025
         if self.time_of_the_day >= 24:
             self.time_of_the_day = 0
@@ -115,21 +211,50 @@ class Grid(object):
     empty = '.'
     rock = '■'
     tree = '♠'
+    sapling = ','
+    water = '~'
+    wall = '░'
+    bed = 'B'
+    indexed_tiles = [tree, rock, bed, wall]
+    # what the tiles are comes from the registry in tiles.py
+    walkable_tiles = frozenset(glyphs_where('walkable'))
+    # tiles dwarfs can not see through
+    opaque_tiles = glyphs_where('opaque')
     trees_ratio = 5
-    wood_per_tree = 15
-    chunks_per_rock = 10
 
     def __init__(self, world, name):
         self.name = name
         self.height = world.world_height
         self.width = world.world_width
-        self.grid = [[Grid.empty for _ in range(self.width)] for _ in range(self.height)]
+        self.grid = self.new_tiles()
+        # bit per cell set where dwarfs can walk, kept up to date by store_tile and load_row
+        self.passable = self.new_passability()
         self.total_size = self.height * self.width
         self.middle_y = world.middle_y
         self.middle_x = world.middle_x
-        self.num_rocks = 0
-        self.num_trees = 0
+        # top left corner of the part shown on the screen, centered on the middle at the start
+        self.view_height = world.view_height
+        self.view_width = world.view_width
+        self.view_top = max(0, min(self.middle_y - self.view_height // 2, self.height - self.view_height))
+        self.view_left = max(0, min(self.middle_x - self.view_width // 2, self.width - self.view_width))
         self.num_dwarfs = 0
+        # where the trees, rocks, beds and walls are, kept up to date by set_tile
+        self.tile_index = TileIndex(self.indexed_tiles, self.height, self.width)
+        self.designations = DesignationBoard(self)
+        # tiles dwarfs will stand on in the next ticks, so more of them can walk around each other
+        self.reservations = ReservationTable()
+        # functions called with (y, x, tile) after every change made through set_tile
+        self.tile_listeners = []
+        # bumped on every tile change, lets caches tell stale results apart
+        self.version = 0
+        self.pathfinder = None
+        self.path_cache = None
+        # searches kept per dwarf and fixed when tiles change, only with --incremental-paths
+        self.path_repair = None
+        # connected walkable areas, answers if a dwarf can get somewhere at all
+        self.regions = None
+        # only tiles dwarfs have seen are shown when set
+        self.fog = None
         # default sleeping spot
         self.bed_y, self.bed_x = self.find_empty_cell_around()
 
@@ -141,13 +266,11 @@ class Grid(object):
         direction_change_cooldown = 4
         for x in range(int(world.max_world_y) + int(world.max_world_x)):
             if y <= world.max_world_y and x <= world.max_world_x and not next_direction_change:
-                self.grid[y][x] = self.rock
-                self.num_rocks += 1
+                self.set_tile(y, x, self.rock)
                 self.fill_with_rocks_to_south_edge(world, y, x)
             elif y < world.max_world_y and x <= world.max_world_x:
                 y += 1
-                self.grid[y][x] = self.rock
-                self.num_rocks += 1
+                self.set_tile(y, x, self.rock)
                 self.fill_with_rocks_to_south_edge(world, y, x)
                 next_direction_change = False
             else:
@@ -161,8 +284,7 @@ class Grid(object):
     def fill_with_rocks_to_south_edge(self, world, y, x):
         y += 1
         while y <= world.max_world_y:
-            self.grid[y][x] = self.rock
-            self.num_rocks += 1
+            self.set_tile(y, x, self.rock)
             y += 1
 
     def generate_trees(self, world):
@@ -172,61 +294,188 @@ class Grid(object):
             while True:
                 y = random.randint(0, world.max_world_y)
                 x = random.randint(0, world.max_world_x)
-                if self.grid[y][x] == self.empty:
-                    self.grid[y][x] = self.tree
-                    self.num_trees += 1
+                if self.get_tile(y, x) == self.empty:
+                    self.set_tile(y, x, self.tree)
                     break
 
+    def new_tiles(self):
+        return [[Grid.empty for _ in range(self.width)] for _ in range(self.height)]
+
+    def new_passability(self):
+        return PassabilityLayer(self.height, self.width, self.walkable_tiles, self.empty)
+
+    def get_tile(self, y, x):
+        return self.grid[y][x]
+
+    def is_walkable(self, y, x):
+        return self.passable.is_walkable(y, x)
+
+    def row(self, y):
+        return self.grid[y]
+
+    def load_row(self, y, text):
+        # a row read from a map file goes straight into the storage, only indexed tiles are looked for
+        self.grid[y] = list(text)
+        self.passable.load_row(y, text)
+        for tile in self.indexed_tiles:
+            xs = []
+            x = text.find(tile)
+            while x != -1:
+                xs.append(x)
+                x = text.find(tile, x + 1)
+            self.tile_index.add_row(tile, y, xs)
+        self.version += 1
+
+    def store_tile(self, y, x, tile):
+        self.grid[y][x] = tile
+        self.passable.set(y, x, tile)
+
+    @property
+    def num_rocks(self):
+        return self.tile_index.count(self.rock)
+
+    @property
+    def num_trees(self):
+        return self.tile_index.count(self.tree)
+
+    def set_tile(self, y, x, tile):
+        self.tile_index.move(y, x, self.get_tile(y, x), tile)
+        self.store_tile(y, x, tile)
+        self.version += 1
+        for listener in self.tile_listeners:
+            listener(y, x, tile)
+
+    def shown_tile(self, y, x):
+        # what the player gets to see at y, x
+        if self.fog is not None and not self.fog.is_explored(y, x):
+            return ' '
+        return self.get_tile(y, x)
+
+    def scroll_view(self, y, x):
+        # move the view as little as possible to have y, x on the screen
+        if y < self.view_top:
+            self.view_top = y
+        elif y >= self.view_top + self.view_height:
+            self.view_top = y - self.view_height + 1
+        if x < self.view_left:
+            self.view_left = x
+        elif x >= self.view_left + self.view_width:
+            self.view_left = x - self.view_width + 1
+
     def display_grid(self, dwarf=None, food=None, cursor=None):
-        for y, row in enumerate(self.grid):
-            for x, cell in enumerate(row):
+        if cursor is not None:
+            self.scroll_view(cursor.y_coord, cursor.x_coord)
+        for y in range(self.view_top, self.view_top + self.view_height):
+            for x in range(self.view_left, self.view_left + self.view_width):
+                cell = self.shown_tile(y, x)
                 if cursor is not None and cursor.y_coord == y and cursor.x_coord == x:
                     print(cursor.representation, end=" ")
                 elif dwarf is not None and dwarf.y_coord == y and dwarf.x_coord == x:
                     print(dwarf.representation, end=" ")
-                elif food is not None and food.y_coord == y and food.x_coord == x:
+                elif food is not None and food.y_coord == y and food.x_coord == x and cell != ' ':
                     print(food.representation, end=" ")
                 else:
                     print(cell, end=" ")
             print()
 
-    def find_empty_cell_around(self, y=None, x=None):
+    def find_empty_cell_around(self, y=None, x=None, skip=()):
+        # nearest empty cell not in skip, looked for in growing square rings around y, x, every ring
+        # starts right above y, x and goes clockwise
         if y is None or x is None:
             y = self.middle_y
             x = self.middle_x
-        direction = 1
-        while True:
-            if self.grid[y][x] == '.':
-                return y, x
+        for radius in range(max(self.height, self.width)):
+            if radius == 0:
+                ring = [(y, x)]
             else:
-                if direction <= 8:
-                    if direction == 1:
-                        y -= 1
-                    elif direction == 2:
-                        y -= 1
-                        x += 1
-                    elif direction == 3:
-                        x += 1
-                    elif direction == 4:
-                        y += 1
-                        x += 1
-                    elif direction == 5:
-                        y += 1
-                    elif direction == 6:
-                        y += 1
-                        x -= 1
-                    elif direction == 7:
-                        x -= 1
-                    elif direction == 8:
-                        y -= 1
-                        x -= 1
-                    direction += 1
-                else:
-                    direction = 1
+                top, bottom, left, right = y - radius, y + radius, x - radius, x + radius
+                ring = [(top, nx) for nx in range(x, right)] + \
+                       [(ny, right) for ny in range(top, bottom)] + \
+                       [(bottom, nx) for nx in range(right, left, -1)] + \
+                       [(ny, left) for ny in range(bottom, top, -1)] + \
+                       [(top, nx) for nx in range(left, x)]
+            for ny, nx in ring:
+                if 0 <= ny < self.height and 0 <= nx < self.width and (ny, nx) not in skip and \
+                        self.get_tile(ny, nx) == self.empty:
+                    return ny, nx
+        return None
+
+
+class ChunkedGrid(Grid):
+    # grid of a world too big to hold, chunks are generated from the seed when first looked at
+
+    def __init__(self, world, name, seed):
+        self.terrain = TerrainGenerator(seed, world.middle_y, self.empty, self.rock, self.tree, self.trees_ratio)
+        # (chunk y, chunk x) -> rows, unchanged chunks in least recently used order
+        self.chunks = OrderedDict()
+        # chunks with player made changes, these can not be generated again
+        self.modified_chunks = set()
+        super().__init__(world, name)
+
+    def new_tiles(self):
+        return None
+
+    def new_passability(self):
+        # no end to keep bits for, tiles are looked up in their chunks
+        return None
+
+    def generate_mountain(self, world):
+        # terrain comes from the seed chunk by chunk
+        pass
+
+    def generate_trees(self, world):
+        pass
+
+    def chunk_at(self, y, x):
+        key = (y // CHUNK_SIZE, x // CHUNK_SIZE)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.load_chunk(key)
+        elif key not in self.modified_chunks:
+            self.chunks.move_to_end(key)
+        return chunk
+
+    def load_chunk(self, key):
+        chunk = self.terrain.chunk(*key)
+        self.chunks[key] = chunk
+        self.index_chunk(key, chunk, True)
+        if len(self.chunks) - len(self.modified_chunks) > MAX_LOADED_CHUNKS:
+            for old_key in self.chunks:
+                if old_key not in self.modified_chunks:
+                    self.index_chunk(old_key, self.chunks.pop(old_key), False)
+                    if self.pathfinder is not None:
+                        # what the pathfinder worked out there goes with the tiles
+                        top, left = old_key[0] * CHUNK_SIZE, old_key[1] * CHUNK_SIZE
+                        self.pathfinder.forget_area(top, left, top + CHUNK_SIZE - 1, left + CHUNK_SIZE - 1)
+                    break
+        return chunk
+
+    def index_chunk(self, key, chunk, loaded):
+        top = key[0] * CHUNK_SIZE
+        left = key[1] * CHUNK_SIZE
+        for dy, row in enumerate(chunk):
+            for dx, tile in enumerate(row):
+                if tile in self.tile_index.buckets:
+                    if loaded:
+                        self.tile_index.move(top + dy, left + dx, None, tile)
+                    else:
+                        self.tile_index.move(top + dy, left + dx, tile, None)
+
+    def get_tile(self, y, x):
+        return self.chunk_at(y, x)[y % CHUNK_SIZE][x % CHUNK_SIZE]
+
+    def is_walkable(self, y, x):
+        return self.get_tile(y, x) in self.walkable_tiles
+
+    def store_tile(self, y, x, tile):
+        self.chunk_at(y, x)[y % CHUNK_SIZE][x % CHUNK_SIZE] = tile
+        self.modified_chunks.add((y // CHUNK_SIZE, x // CHUNK_SIZE))
 
 
 class Dwarf(object):
     representation = 'A'
+    # ticks a goal takes once the dwarf is there, the ones not listed take one
+    work_ticks = {'chop': 3, 'mine': 3, 'build': 2}
 
     def __init__(self, location, name, y=None, x=None):
         self.name = name
@@ -239,68 +488,63 @@ class Dwarf(object):
         self.hp = 30
         self.hunger = 100
         self.eq = {'wood': 0, 'rock_chunks': 0, 'food': 0}
+        # planned steps, the next one at the end, and the goal they lead to
+        self.path = []
+        self.path_goal = None
+        # next few steps planned around other dwarfs, the next one at the end, and the tick of it
+        self.steps = []
+        self.steps_tick = None
+        # goal name -> how many times it was done
+        self.goals_done = {}
+        # (goal, y, x) being worked on and the ticks left until it is done
+        self.task = None
+        self.work_left = 0
         location.num_dwarfs += 1
 
-    def dwarf_action(self, world, location, food, cursor, key_event_canvas):
+    def dwarf_action(self, world, location, food, cursor, screen):
         self.dwarf_move(world, location, cursor)
         # (cursor.goal is not None) perhaps will need later
         if (cursor.goal in ['go', 'sleep'] and (self.y_coord == cursor.goal_y_coord and
                                                 self.x_coord == cursor.goal_x_coord)) or \
                 (cursor.goal in ['chop', 'mine', 'build', 'eat'] and
                  [self.y_coord, self.x_coord] in cursor.goal_neighbourhood.values()):
-            # refresh screen after moving to the target and before taking action
-            clear_console()
-            location.display_grid(self, food, cursor)
-            hud(world, location, self, food, cursor)
-            time.sleep(world.speed)
-            world.world_tick()
-            if cursor.goal == 'chop':
-                time.sleep(0.5)
-                location.grid[cursor.goal_y_coord][cursor.goal_x_coord] = location.empty
-                self.eq['wood'] += location.wood_per_tree
-            if cursor.goal == 'mine':
-                time.sleep(0.5)
-                location.grid[cursor.goal_y_coord][cursor.goal_x_coord] = location.empty
-                self.eq['rock_chunks'] += location.chunks_per_rock
+            # the work goes on over ticks of the main loop, a new goal starts it again
+            task = (cursor.goal, cursor.goal_y_coord, cursor.goal_x_coord)
+            if self.task != task:
+                self.task = task
+                self.work_left = self.work_ticks.get(cursor.goal, 1)
+            self.work_left -= 1
+            if self.work_left > 0:
+                return
+            self.task = None
+            if cursor.goal in ['chop', 'mine']:
+                # what it gives is looked up before the tile is gone
+                worked = tile_type(location.get_tile(cursor.goal_y_coord, cursor.goal_x_coord))
+                location.set_tile(cursor.goal_y_coord, cursor.goal_x_coord, location.empty)
+                if worked.yields is not None:
+                    item, amount = worked.yields
+                    self.eq[item] += amount
             if cursor.goal == 'build':
-                if self.eq['wood'] < 5:
-                    print("Not enough wood, chop some by pointing at a tree ♠ and pressing 'c'")
-                    print("Press enter")
-                    key = ''
-                    while key != 'enter':
-                        key_event_canvas.update()
-                        key = key_event_canvas.stored_key
-                        key_event_canvas.reset_stored_key()
+                if self.eq['wood'] < 5 and cursor.goal_designation is not None:
+                    # no wood for the rest of the designated walls either
+                    location.designations.cancel(cursor.goal_designation)
+                elif self.eq['wood'] < 5:
+                    # the game goes on, the order is dropped
+                    screen.show_message("Not enough wood, chop some by pointing at a tree ♠ and pressing 'c'")
                 else:
-                    print("What would you like to build?(options are: bed, wall)")
-                    key = ''
-                    input_building = ''
-                    while True:
-                        while key != 'enter':
-                            key_event_canvas.update()
-                            key = key_event_canvas.stored_key
-                            key_event_canvas.reset_stored_key()
-                            if key != 'enter' and key is not None:
-                                input_building += str(key)
-                                print(input_building)
-                        input_building = input_building.lower()
-                        if input_building in world.list_of_allowed_buildings:
-                            break
-                        key = ''
-                        input_building = ''
-                        print("Please enter a correct command")
-                        print("What would you like to build?(options are: bed, wall)")
-                    if input_building in ['w', 'wall']:
-                        location.grid[cursor.goal_y_coord][cursor.goal_x_coord] = '░'
+                    # the building was chosen when the order was given, walls are the default
+                    if cursor.goal_building in [None, 'w', 'wall']:
+                        location.set_tile(cursor.goal_y_coord, cursor.goal_x_coord, location.wall)
                         self.eq['wood'] -= 5
-                    elif input_building in ['b', 'bed']:
-                        location.grid[cursor.goal_y_coord][cursor.goal_x_coord] = 'B'
+                    elif cursor.goal_building in ['b', 'bed']:
+                        location.set_tile(cursor.goal_y_coord, cursor.goal_x_coord, location.bed)
                         location.bed_y, location.bed_x = cursor.goal_y_coord, cursor.goal_x_coord
                         self.eq['wood'] -= 5
             if cursor.goal == 'eat':
                 food.amount -= 1
                 self.hunger = 100
-            cursor.goal = None
+            self.goals_done[cursor.goal] = self.goals_done.get(cursor.goal, 0) + 1
+            cursor.drop_goal(location, self)
 
     def dwarf_move(self, world, location, cursor):
         self.previous_y_coord = self.y_coord
@@ -309,78 +553,162 @@ class Dwarf(object):
                                                 self.x_coord != cursor.goal_x_coord)) or \
                 (cursor.goal in ['chop', 'mine', 'build', 'eat'] and
                  [self.y_coord, self.x_coord] not in cursor.goal_neighbourhood.values()):
+            if self.follow_path(world, location, cursor):
+                return
+            if cursor.goal_designation is not None and location.path_cache is not None:
+                # designated tile is out of reach, leave it and take the next one
+                cursor.drop_goal(location, self)
+                return
+            # no planner or no known route, old step by step walking
             if self.y_coord < cursor.goal_y_coord and \
-                    location.grid[self.y_coord + 1][self.x_coord] in world.allowed_to_step_on and \
+                    location.is_walkable(self.y_coord + 1, self.x_coord) and \
                     self.y_coord + 1 != world.max_world_y:
                 self.y_coord += 1
             elif self.y_coord > cursor.goal_y_coord and \
-                    location.grid[self.y_coord - 1][self.x_coord] in world.allowed_to_step_on and \
+                    location.is_walkable(self.y_coord - 1, self.x_coord) and \
                     self.y_coord - 1 != -1:
                 self.y_coord -= 1
             elif self.x_coord < cursor.goal_x_coord and \
-                    location.grid[self.y_coord][self.x_coord + 1] in world.allowed_to_step_on and \
+                    location.is_walkable(self.y_coord, self.x_coord + 1) and \
                     self.x_coord + 1 != world.world_width:
                 self.x_coord += 1
             elif self.x_coord > cursor.goal_x_coord and \
-                    location.grid[self.y_coord][self.x_coord - 1] in world.allowed_to_step_on and \
+                    location.is_walkable(self.y_coord, self.x_coord - 1) and \
                     self.x_coord - 1 != -1:
                 self.x_coord -= 1
+            if self.previous_y_coord == self.y_coord and self.previous_x_coord == self.x_coord and \
+                    not self.can_step_anywhere(world, location):
+                # walled in, nothing to do until something around is chopped or mined
+                return
             while self.previous_y_coord == self.y_coord and self.previous_x_coord == self.x_coord:
                 if self.y_coord == cursor.goal_y_coord:
                     # smart: when on the same y as goal, I want to implement it also for the same x as goal
                     if self.x_coord > cursor.goal_x_coord:
                         if self.y_coord + 1 != world.world_width and self.x_coord - 1 != -1 and \
-                                location.grid[self.y_coord + 1][self.x_coord - 1] in world.allowed_to_step_on:
+                                location.is_walkable(self.y_coord + 1, self.x_coord - 1):
                             self.y_coord += 1
                             self.x_coord -= 1
                         elif self.y_coord - 1 != -1 and self.x_coord - 1 != -1 and \
-                                location.grid[self.y_coord - 1][self.x_coord - 1] in world.allowed_to_step_on:
+                                location.is_walkable(self.y_coord - 1, self.x_coord - 1):
                             self.y_coord -= 1
                             self.x_coord -= 1
                     if self.x_coord < cursor.goal_x_coord:
                         if self.y_coord + 1 != world.world_width and self.x_coord + 1 != world.world_width and \
-                                location.grid[self.y_coord + 1][self.x_coord + 1] in world.allowed_to_step_on:
+                                location.is_walkable(self.y_coord + 1, self.x_coord + 1):
                             self.y_coord += 1
                             self.x_coord += 1
                         elif self.y_coord - 1 != -1 and self.x_coord + 1 != world.world_width and \
-                                location.grid[self.y_coord - 1][self.x_coord + 1] in world.allowed_to_step_on:
+                                location.is_walkable(self.y_coord - 1, self.x_coord + 1):
                             self.y_coord -= 1
                             self.x_coord += 1
                 if self.previous_y_coord == self.y_coord and self.previous_x_coord == self.x_coord:
                     for i in range(3):
                         direction = random.randint(1, 4)
                         if direction == 1 and self.y_coord + 1 != world.world_width \
-                                and location.grid[self.y_coord + 1][self.x_coord] in world.allowed_to_step_on:
+                                and location.is_walkable(self.y_coord + 1, self.x_coord):
                             self.y_coord += 1
                         elif direction == 2 and self.y_coord - 1 != -1 \
-                                and location.grid[self.y_coord - 1][self.x_coord] in world.allowed_to_step_on:
+                                and location.is_walkable(self.y_coord - 1, self.x_coord):
                             self.y_coord -= 1
                         elif direction == 3 and self.x_coord + 1 != world.world_width \
-                                and location.grid[self.y_coord][self.x_coord + 1] in world.allowed_to_step_on:
+                                and location.is_walkable(self.y_coord, self.x_coord + 1):
                             self.x_coord += 1
                         elif direction == 4 and self.x_coord - 1 != - 1 \
-                                and location.grid[self.y_coord][self.x_coord - 1] in world.allowed_to_step_on:
+                                and location.is_walkable(self.y_coord, self.x_coord - 1):
                             self.x_coord -= 1
+        elif location.num_dwarfs > 1:
+            # there already or nowhere to go, the others plan around the tile it stands on
+            location.reservations.stand(self, self.y_coord, self.x_coord, world.tick)
+
+    def can_step_anywhere(self, world, location):
+        for y, x in ((self.y_coord - 1, self.x_coord), (self.y_coord, self.x_coord + 1),
+                     (self.y_coord + 1, self.x_coord), (self.y_coord, self.x_coord - 1)):
+            if 0 <= y <= world.max_world_y and 0 <= x <= world.max_world_x and \
+                    location.is_walkable(y, x):
+                return True
+        return False
+
+    def goal_cells(self, world, cursor):
+        # cells the dwarf has to stand on to fulfil the goal
+        if cursor.goal in ['go', 'sleep']:
+            return [(cursor.goal_y_coord, cursor.goal_x_coord)]
+        return [(y, x) for y, x in cursor.goal_neighbourhood.values()
+                if 0 <= y <= world.max_world_y and 0 <= x <= world.max_world_x]
+
+    def forget_route(self, location):
+        # the goal is gone, a search kept for it would only hold on to memory
+        if location.path_repair is not None:
+            location.path_repair.forget(self)
+
+    def stop_work(self, location):
+        # whatever it was working on or walking to is left
+        self.task = None
+        self.work_left = 0
+        self.forget_route(location)
+
+    def follow_path(self, world, location, cursor):
+        if location.path_cache is None:
+            return False
+        goal = (cursor.goal, cursor.goal_y_coord, cursor.goal_x_coord)
+        # tiles the route was planned over changed, it may be blocked further on or a shorter one opened
+        stale = location.path_repair is not None and location.path_repair.is_stale(self)
+        if self.path_goal != goal or self.steps_tick != world.tick or stale or \
+                (self.steps and not location.is_walkable(*self.steps[-1])):
+            # new goal, a skipped tick or a step that got blocked, the planned steps are no good
+            self.steps = []
+        if self.path_goal != goal or (not self.steps and not self.path) or stale or \
+                (self.path and not location.is_walkable(*self.path[-1])):
+            start, goals = (self.y_coord, self.x_coord), self.goal_cells(world, cursor)
+            if location.path_repair is None:
+                path = location.path_cache.find_path(start, goals)
+            else:
+                path = location.path_repair.find_path(self, start, goals)
+            self.path = [] if path is None else path[::-1]
+            self.path_goal = goal
+        if not self.steps:
+            if not self.path:
+                return False
+            if location.num_dwarfs < 2:
+                self.steps = [self.path.pop()]
+            else:
+                route = self.path[-1:-COOPERATIVE_WINDOW - 1:-1]
+                steps, reached = location.reservations.plan(
+                    self, location.is_walkable, (self.y_coord, self.x_coord), route, world.tick,
+                    (0, 0, world.max_world_y, world.max_world_x))
+                self.steps = steps[::-1]
+                if reached:
+                    del self.path[-reached:]
+                else:
+                    # the steps do not end on the route, it is planned again from where they do
+                    self.path = []
+        self.y_coord, self.x_coord = self.steps.pop()
+        self.steps_tick = world.tick + 1
+        return True
 
     def status(self, world, location, cursor, food):
         self.hunger -= 0.1
         if self.hunger < 50:
-            cursor.create_goal(world, location, 'hungry', food)
+            cursor.create_goal(world, location, 'hungry', food, self)
         if self.hunger < 0:
             self.hp -= 1
         if cursor.goal is None and world.is_it_night_or_day == 'night' and (self.y_coord != location.bed_y or
                                                                             self.x_coord != location.bed_x):
-            cursor.create_goal(world, location, 'sleepy')
+            cursor.create_goal(world, location, 'sleepy', dwarf=self)
 
 
 class Food(object):
     representation = '♥'
 
-    def __init__(self, location, dwarf=None):
-        if dwarf is None:
+    def __init__(self, location, dwarf=None, y=None, x=None):
+        if y is not None and x is not None:
+            self.y_coord, self.x_coord = location.find_empty_cell_around(y, x)
+        elif dwarf is None:
             self.y_coord, self.x_coord = location.find_empty_cell_around()
         else:
-            self.y_coord, self.x_coord = location.find_empty_cell_around(dwarf.y_coord + 1, dwarf.x_coord + 1)
+            # never under the dwarf or on its bed, it would be hidden there
+            self.y_coord, self.x_coord = location.find_empty_cell_around(
+                dwarf.y_coord + 1, dwarf.x_coord + 1,
+                skip=[(dwarf.y_coord, dwarf.x_coord), (location.bed_y, location.bed_x)])
         self.amount = 500
         self.neighbourhood = {1: [self.y_coord - 1, self.x_coord],
                               2: [self.y_coord, self.x_coord + 1],
@@ -390,132 +718,577 @@ class Food(object):
 
 class Cursor(object):
     representation = '☼'
+    # nearest trees or rocks looked at for one reachable by the idle dwarf
+    auto_goal_candidates = 8
+    # designated tiles looked at in one tick for one the dwarf can get to
+    job_checks_per_tick = 64
 
     def __init__(self, location):
-        self.y_coord = 0
-        self.x_coord = 0
+        self.y_coord = location.view_top
+        self.x_coord = location.view_left
         self.neighbourhood = {}
-        self.target = location.grid[self.y_coord][self.x_coord]
+        self.target = location.get_tile(self.y_coord, self.x_coord)
         self.goal = None
         self.goal_y_coord = None
         self.goal_x_coord = None
         self.goal_neighbourhood = {}
+        # designation the current goal was taken from and what to build there
+        self.goal_designation = None
+        self.goal_building = None
+        # first corner of a rectangle being designated
+        self.designation_corner = None
+        # last position a goal was refused at because the dwarf can not get there
+        self.unreachable = None
+        # text typed for a build order while its prompt is open, None when it is closed,
+        # the game keeps running while it is typed
+        self.build_order = None
+        self.build_order_tile = None
+        # confirmed (y, x, building) orders the dwarf builds one by one when idle
+        self.build_orders = deque()
+
+    def move_cursor(self, world, location, key='', steps=1):
+        # steps is how many times the arrow was pressed since the last tick
+        if key == 'up':
+            self.y_coord = max(self.y_coord - steps, 0)
+        elif key == 'left':
+            self.x_coord = max(self.x_coord - steps, 0)
+        elif key == 'right':
+            self.x_coord = min(self.x_coord + steps, world.max_world_x)
+        elif key == 'down':
+            self.y_coord = min(self.y_coord + steps, world.max_world_y)
+        self.target = location.get_tile(self.y_coord, self.x_coord)
+
+    def target_goal(self, goal, y, x):
+        self.goal = goal
+        self.goal_y_coord = y
+        self.goal_x_coord = x
+        self.goal_neighbourhood = {1: [y - 1, x],
+                                   2: [y, x + 1],
+                                   3: [y + 1, x],
+                                   4: [y, x - 1]}
+        self.goal_designation = None
+        self.goal_building = None
 
-    def move_cursor(self, world, location, key=''):
-        if key == 'up' and self.y_coord > 0:
-            self.y_coord -= 1
-        elif key == 'left' and self.x_coord > 0:
-            self.x_coord -= 1
-        elif key == 'right' and self.x_coord < world.max_world_x:
-            self.x_coord += 1
-        elif key == 'down' and self.y_coord < world.max_world_y:
-            self.y_coord += 1
-        self.target = location.grid[self.y_coord][self.x_coord]
-
-    def create_goal(self, world, location, key, food=None):
+    def goal_reachable(self, world, location, dwarf):
+        if location.regions is None:
+            return True
+        return location.regions.reachable((dwarf.y_coord, dwarf.x_coord), dwarf.goal_cells(world, self))
+
+    def create_goal(self, world, location, key, food=None, dwarf=None):
         self.neighbourhood = {1: [self.y_coord - 1, self.x_coord],
                               2: [self.y_coord, self.x_coord + 1],
                               3: [self.y_coord + 1, self.x_coord],
                               4: [self.y_coord, self.x_coord - 1]}
         if world.is_it_night_or_day == 'day':
-            if key == 'm' and self.target == '■':
+            target = tile_type(self.target)
+            if key == 'm' and target.minable:
                 self.goal = 'mine'
                 self.goal_y_coord = self.y_coord
                 self.goal_x_coord = self.x_coord
                 self.goal_neighbourhood = self.neighbourhood
-            elif key == 'c' and self.target == '♠':
+            elif key == 'c' and target.choppable:
                 self.goal = 'chop'
                 self.goal_y_coord = self.y_coord
                 self.goal_x_coord = self.x_coord
                 self.goal_neighbourhood = self.neighbourhood
-            elif key == 'b' and self.target == '.':
-                self.goal = 'build'
-                self.goal_y_coord = self.y_coord
-                self.goal_x_coord = self.x_coord
-                self.goal_neighbourhood = self.neighbourhood
-            elif key == 'g' and self.target == '.':
+            elif key == 'g' and target.walkable:
                 self.goal = 'go'
                 self.goal_y_coord = self.y_coord
                 self.goal_x_coord = self.x_coord
+            if self.goal is not None and dwarf is not None and not self.goal_reachable(world, location, dwarf):
+                self.unreachable = (self.y_coord, self.x_coord)
+                self.goal = None
         if key == 'hungry' and food is not None:
+            if dwarf is not None and self.goal != 'eat':
+                # hunger takes over, the work is left unfinished
+                dwarf.stop_work(location)
+            if self.goal_designation is not None:
+                # give the designated tile back, it is done after the meal
+                location.designations.release(self.goal_designation, self.goal_y_coord, self.goal_x_coord)
+                self.goal_designation = None
+                self.goal_building = None
             self.goal = 'eat'
             self.goal_y_coord = food.y_coord
             self.goal_x_coord = food.x_coord
             self.goal_neighbourhood = food.neighbourhood
         if key == 'sleepy':
+            if dwarf is not None and self.goal != 'sleep':
+                dwarf.stop_work(location)
             self.goal = 'sleep'
             self.goal_y_coord = location.bed_y
             self.goal_x_coord = location.bed_x
 
+    def open_build_order(self):
+        self.build_order = ''
+        self.build_order_tile = (self.y_coord, self.x_coord)
 
-def hud(world, location, dwarf, food, cursor):
-    print()
-    print("time:", int(world.time_of_the_day),
-          "it is", world.is_it_night_or_day,
-          "| HP:", dwarf.hp,
-          "| stomach fullness:", int(dwarf.hunger),
-          "| game speed:", world.speed_name)
-    # EQ bar
-    print("Equipment:", "wood:", dwarf.eq['wood'],
-          "| rock chunks:", dwarf.eq['rock_chunks'],
-          "| food:", dwarf.eq['food'])
-    # controls
-    print("arrows - move cursor, c - chop tree ♠, m - mine rock ■, b - build wooden wall ░ or bed B,"
-          " g - go fo a walk, r - rescue(stop current task), q - quit")
+    def type_build_order(self, world, key, screen):
+        # one key of the open prompt, enter queues the order when it names a building
+        if key is None:
+            return
+        if key == 'Escape':
+            self.build_order = None
+        elif key == 'BackSpace':
+            self.build_order = self.build_order[:-1]
+        elif key == 'enter':
+            building = self.build_order.lower()
+            if building in world.list_of_allowed_buildings:
+                self.build_orders.append(self.build_order_tile + (building,))
+                self.build_order = None
+            else:
+                self.build_order = ''
+                screen.show_message("Please enter a correct command")
+        elif len(key) == 1:
+            self.build_order += key
+
+    def take_build_order(self, world, location, dwarf):
+        if world.is_it_night_or_day != 'day':
+            return
+        while self.build_orders:
+            y, x, building = self.build_orders.popleft()
+            if not tile_type(location.get_tile(y, x)).buildable_on:
+                continue
+            self.target_goal('build', y, x)
+            self.goal_building = building
+            if self.goal_reachable(world, location, dwarf):
+                return
+            self.unreachable = (y, x)
+            self.goal = None
+            self.goal_building = None
+
+    def create_auto_goal(self, world, location, dwarf):
+        # idle dwarf goes for the nearest tree, or the nearest rock when there are no trees left
+        if world.is_it_night_or_day != 'day':
+            return
+        for goal, tile in (('chop', location.tree), ('mine', location.rock)):
+            for y, x in location.tile_index.nearest(tile, dwarf.y_coord, dwarf.x_coord, self.auto_goal_candidates):
+                self.target_goal(goal, y, x)
+                if self.goal_reachable(world, location, dwarf):
+                    return
+                self.goal = None
+
+    def follow_decision(self, world, location, dwarf, food, action, target):
+        # what the dwarf decided on its own, needs win over work, work waits for an idle dwarf
+        if action == 'eat' and self.goal != 'eat':
+            self.create_goal(world, location, 'hungry', food, dwarf)
+        elif action == 'sleep' and self.goal not in ['eat', 'sleep']:
+            # already in bed it just sleeps on, a goal would be done at once and make it decide again
+            if (dwarf.y_coord, dwarf.x_coord) != (location.bed_y, location.bed_x):
+                self.create_goal(world, location, 'sleepy', dwarf=dwarf)
+        elif self.goal is not None:
+            return
+        elif action in ['chop', 'mine'] and target is not None:
+            self.target_goal(action, *target)
+            if not self.goal_reachable(world, location, dwarf):
+                self.goal = None
+        elif action == 'build':
+            self.take_designated_job(world, location, dwarf)
+
+    def take_designated_job(self, world, location, dwarf=None):
+        if world.is_it_night_or_day != 'day':
+            return
+        for _ in range(self.job_checks_per_tick):
+            job = location.designations.next_job()
+            if job is None:
+                return
+            designation, y, x = job
+            if designation.job == 'wall':
+                self.target_goal('build', y, x)
+                self.goal_building = 'wall'
+            else:
+                self.target_goal(designation.job, y, x)
+            if dwarf is None or self.goal_reachable(world, location, dwarf):
+                self.goal_designation = designation
+                return
+            # sealed off tile, dropped like one the path search gave up on
+            self.goal = None
+            self.goal_building = None
+
+    def create_designation(self, location, key):
+        job = {'c': 'chop', 'm': 'mine', 'w': 'wall'}[key]
+        location.designations.designate(job, self.designation_corner[0], self.designation_corner[1],
+                                        self.y_coord, self.x_coord)
+        self.designation_corner = None
+
+    def cancel_designation(self, location, dwarf=None):
+        designation = location.designations.designation_at(self.y_coord, self.x_coord)
+        if designation is not None:
+            location.designations.cancel(designation)
+            if self.goal_designation is designation:
+                self.drop_goal(location, dwarf)
+
+    def drop_goal(self, location, dwarf=None):
+        # the goal is done or given up, the dwarf following it stops too
+        if dwarf is not None:
+            dwarf.stop_work(location)
+        self.goal = None
+        self.goal_designation = None
+        self.goal_building = None
+
+
+def tick_rate_text(world):
+    target = world.clock.target_rate()
+    if target is None:
+        return '({:.0f} ticks/s)'.format(world.clock.achieved_rate())
+    return '({:.1f} of {:g} ticks/s)'.format(world.clock.achieved_rate(), target)
+
+
+def hud_lines(world, location, dwarf, food, cursor):
+    lines = ["",
+             "time: {} it is {} | HP: {} | stomach fullness: {} | game speed: {} {} | auto work: {}".format(
+                 int(world.time_of_the_day), world.is_it_night_or_day, dwarf.hp, int(dwarf.hunger),
+                 world.speed_name, tick_rate_text(world), 'on' if world.auto_work else 'off'),
+             # EQ bar
+             "Equipment: wood: {} | rock chunks: {} | food: {}".format(
+                 dwarf.eq['wood'], dwarf.eq['rock_chunks'], dwarf.eq['food']),
+             # controls
+             "arrows - move cursor, c - chop tree ♠, m - mine rock ■, b - build wooden wall ░ or bed B,"
+             " g - go fo a walk, a - auto chop/mine, r - rescue(stop current task), q - quit",
+             "d - mark a corner, then c/m/w - designate the rectangle for chopping, mining or walls,"
+             " x - cancel a designation"]
     # logic for displaying info about current position od cursor
-    if cursor.target == '♠':
-        print("Currently pointing at: green ♠")
-    if cursor.target == '■':
-        print("Currently pointing at: rocky ■")
-    if cursor.target == '░':
-        print("Currently pointing at: wooden ░")
+    if len(world.sites) > 1:
+        lines.append("Location: {} of {} | l - go to the next one".format(location.name, len(world.sites)))
+    if world.history is not None:
+        lines.append("History: {} snapshots kept | u - go {} ticks back in time".format(
+            len(world.history.snapshots), world.history.interval))
+    description = tile_type(cursor.target).description
+    if description is not None:
+        lines.append("Currently pointing at: " + description)
+    if dwarf.task is not None:
+        lines.append("Working on: {} ({} ticks left)".format(dwarf.task[0], dwarf.work_left))
+    if cursor.build_order is not None:
+        lines.append("What would you like to build? (bed or wall, enter - confirm, escape - cancel): "
+                     + cursor.build_order)
+    if cursor.build_orders:
+        lines.append("Build orders waiting: {}".format(len(cursor.build_orders)))
+    if (cursor.y_coord, cursor.x_coord) == cursor.unreachable:
+        lines.append("The dwarf can not get there")
     if [cursor.y_coord, cursor.x_coord] == [dwarf.y_coord, dwarf.x_coord]:
-        print("Currently pointing at: nice dwarf A")
+        lines.append("Currently pointing at: nice dwarf A")
     if [cursor.y_coord, cursor.x_coord] == [food.y_coord, food.x_coord]:
-        print("Currently pointing at: food in quantity: " + str(food.amount))
-    print()
+        lines.append("Currently pointing at: food in quantity: " + str(food.amount))
+    if cursor.designation_corner is not None:
+        lines.append("Designating from {} - move the cursor and press c, m or w, d to drop the corner".format(
+            cursor.designation_corner))
+    designation = location.designations.designation_at(cursor.y_coord, cursor.x_coord)
+    if designation is not None:
+        lines.append("Designated for: {} | x - cancel the whole designation".format(designation.job))
+    lines.append("")
+    return lines
+
+
+# metrics recorded every tick with --telemetry, in the order telemetry_values gives them
+telemetry_names = ['trees', 'rocks', 'wood', 'rock chunks', 'food carried', 'food left',
+                   'hunger min', 'hunger mean', 'hunger max', 'hp min', 'hp mean', 'hp max', 'goals done']
+
+
+def telemetry_values(location, dwarfs, food):
+    hunger = [dwarf.hunger for dwarf in dwarfs]
+    hp = [dwarf.hp for dwarf in dwarfs]
+    return (location.num_trees, location.num_rocks,
+            sum(dwarf.eq['wood'] for dwarf in dwarfs), sum(dwarf.eq['rock_chunks'] for dwarf in dwarfs),
+            sum(dwarf.eq['food'] for dwarf in dwarfs), food.amount,
+            min(hunger), sum(hunger) / len(hunger), max(hunger), min(hp), sum(hp) / len(hp), max(hp),
+            sum(sum(dwarf.goals_done.values()) for dwarf in dwarfs))
+
+
+def hud(world, location, dwarf, food, cursor):
+    for line in hud_lines(world, location, dwarf, food, cursor):
+        print(line)
+
+
+class ConsoleScreen(object):
+    # prints every frame into a cleared console
+    def show_text(self, lines):
+        for line in lines:
+            print(line)
+
+    def show_message(self, text):
+        print(text)
+
+    def start(self, world, location):
+        clear_console()
+
+    def draw(self, world, location, dwarf, food, cursor):
+        clear_console()
+        location.display_grid(dwarf, food, cursor)
+        hud(world, location, dwarf, food, cursor)
+
+    def close(self):
+        pass
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Karel Fortress')
+    parser.add_argument('--seed', type=int, help='play in an endless world generated from this seed')
+    parser.add_argument('--input', choices=['auto', 'tk', 'terminal'], default='auto',
+                        help='read keys from a tkinter window or straight from the terminal')
+    parser.add_argument('--frontend', choices=['console', 'curses'], default='console',
+                        help='print frames into the console or draw them with curses')
+    parser.add_argument('--startup-report', action='store_true', help='print how long the start took on exit')
+    parser.add_argument('--input-report', action='store_true',
+                        help='print on exit how long keys waited for the game and how many were dropped')
+    parser.add_argument('--map', metavar='FILE', help='play on a map loaded from a text file')
+    parser.add_argument('--save-map', metavar='FILE', help='write the map into a text file on quit')
+    parser.add_argument('--telemetry', metavar='FILE',
+                        help='record fortress metrics every tick and write them on quit, as CSV for a .csv name')
+    parser.add_argument('--utility-ai', action='store_true',
+                        help='with auto work on, let the dwarf weigh eating, sleeping and work itself (needs NumPy)')
+    parser.add_argument('--history', action='store_true',
+                        help='keep snapshots of the fortress, u goes {} ticks back in time'.format(SNAPSHOT_INTERVAL))
+    parser.add_argument('--sites', type=int, default=1, metavar='N',
+                        help='play N locations, l switches between them, the others are simulated in totals')
+    parser.add_argument('--minimap', action='store_true',
+                        help='draw the whole map one pixel per tile in the tkinter window')
+    parser.add_argument('--incremental-paths', action='store_true',
+                        help='fix the paths dwarfs walk when tiles change instead of planning them again')
+    parser.add_argument('--fog', action='store_true', help='only show what the dwarf has seen')
+    parser.add_argument('--regrowth', action='store_true', help='let trees spread and grow back (needs NumPy)')
+    parser.add_argument('--water', action='store_true', help='with --regrowth, let water seep into mined tunnels')
+    parser.add_argument('--spectate', type=int, metavar='PORT',
+                        help='let others watch the game on this local port (python spectator.py PORT)')
+    args = parser.parse_args()
+    if args.regrowth and args.seed is not None:
+        parser.error('--regrowth needs the whole map, it can not be used with --seed')
+    if args.map is not None and args.seed is not None:
+        parser.error('--map and --seed both make the map, pick one')
+    if args.history and args.seed is not None:
+        parser.error('--history needs the whole map, it can not be used with --seed')
+    if args.incremental_paths and args.seed is not None:
+        parser.error('--incremental-paths needs the whole map, it can not be used with --seed')
+    if args.minimap and args.seed is not None:
+        parser.error('--minimap needs the whole map, it can not be used with --seed')
+    if args.minimap and (args.frontend == 'curses' or args.input == 'terminal'):
+        parser.error('--minimap is drawn in the tkinter window, it needs --input tk')
+    if args.minimap:
+        args.input = 'tk'
+    if args.sites < 1:
+        parser.error('--sites needs at least one site')
+    if args.sites > 1:
+        for option in ('regrowth', 'utility_ai', 'history', 'spectate'):
+            if getattr(args, option):
+                parser.error('--{} only follows one location, it can not be used with --sites'.format(
+                    option.replace('_', '-')))
     # assuming future option for multiple locations it is one "world" class to bond them all
-    world = World('home-world')
+    if args.map is not None:
+        from map_files import map_size, MapFormatError
+        try:
+            height, width = map_size(args.map)
+        except (OSError, MapFormatError) as error:
+            parser.error(str(error))
+        world = World('home-world', width, height)
+    elif args.seed is None:
+        world = World('home-world')
+    else:
+        world = World('home-world', World.unbounded_size, World.unbounded_size)
     # keyboard input capturing class, hated to leave it be in peace partially useless,
     # so beware, it may have some wired shit inside
-    key_event_canvas = KeyEventCanvas(process_key)
-    greeting_screen(world, key_event_canvas)
-    # create world
-    home = Grid(world, 'home')
-    home.generate_mountain(world)
-    home.generate_trees(world)
+    if args.frontend == 'curses':
+        from curses_frontend import CursesScreen
+        # curses owns the terminal, it reads the keys too
+        screen = CursesScreen(process_key, hud_lines)
+        key_event_canvas = screen
+    else:
+        screen = ConsoleScreen()
+        key_event_canvas = create_input(args.input, process_key)
+    startup_times['input'] = time.perf_counter() - STARTED
+    try:
+        site = play(args, world, key_event_canvas, screen)
+    finally:
+        key_event_canvas.close()
+        if screen is not key_event_canvas:
+            screen.close()
+    if args.save_map is not None:
+        from map_files import write_map
+        # after the screen is closed, so what had to be moved can be told
+        for character, (y, x) in write_map(args.save_map, site.location, site.dwarfs[0], site.food):
+            print("{}: {} saved at row {} column {}, its own tile was taken".format(
+                args.save_map, character, y + 1, x + 1))
+    if args.startup_report:
+        report_startup()
+    if args.input_report:
+        print(key_event_canvas.keys.report())
+
+
+def create_site(args, world, name, first=True):
+    # location with its dwarf, food and cursor, only the first one comes from --seed or --map
+    if not first or args.seed is None:
+        location = Grid(world, name)
+    else:
+        location = ChunkedGrid(world, name, args.seed)
+    if not first or args.map is None:
+        location.generate_mountain(world)
+        location.generate_trees(world)
+    else:
+        from map_files import read_map, first_empty, MapFormatError
+        try:
+            dwarf_position, food_position = read_map(args.map, location)
+        except MapFormatError as error:
+            raise SystemExit(str(error))
+        if dwarf_position is None:
+            dwarf_position = first_empty(location)
+        if food_position is None:
+            food_position = first_empty(location, skip=dwarf_position)
+        if dwarf_position is None or food_position is None:
+            raise SystemExit('{}: the map needs two empty tiles for the dwarf and the food'.format(args.map))
+        beds = location.tile_index.nearest(location.bed, *dwarf_position)
+        location.bed_y, location.bed_x = beds[0] if beds else dwarf_position
+    if isinstance(location, ChunkedGrid):
+        # nothing stops a search in an endless world but its budget
+        location.pathfinder = HierarchicalPathfinder(location, node_budget=ENDLESS_NODE_BUDGET)
+    else:
+        # clusters are worked out when a search gets to them and the regions on the first question,
+        # a big map starts at once
+        location.pathfinder = HierarchicalPathfinder(location)
+        location.regions = ConnectivityRegions(location)
+    location.path_cache = PathCache(location, location.pathfinder)
+    if args.incremental_paths:
+        location.path_repair = PathRepair(location)
     # create creatures
-    dwarf = Dwarf(home, 'Lee')
-    # create items
-    food = Food(home, dwarf)
+    if not first or args.map is None:
+        dwarf = Dwarf(location, 'Lee')
+        # create items
+        food = Food(location, dwarf)
+    else:
+        dwarf = Dwarf(location, 'Lee', *dwarf_position)
+        food = Food(location, y=food_position[0], x=food_position[1])
     # create other stuff
-    cursor = Cursor(home)
-    clear_console()
+    cursor = Cursor(location)
+    if args.fog:
+        location.fog = FogOfWar(location, location.opaque_tiles)
+        location.fog.update(dwarf, dwarf.y_coord, dwarf.x_coord)
+    return Site(name, location, [dwarf], food, cursor)
+
+
+def play(args, world, key_event_canvas, screen):
+    greeting_screen(world, key_event_canvas, screen)
+    # create world
+    world.add_site(create_site(args, world, 'home'))
+    for number in range(2, args.sites + 1):
+        world.add_site(create_site(args, world, 'site {}'.format(number), False))
+    site = world.focused_site()
+    home, dwarf, food, cursor = site.location, site.dwarfs[0], site.food, site.cursor
+    environment = None
+    if args.regrowth:
+        from environment import EnvironmentLayer
+        environment = EnvironmentLayer(home, home.sapling, home.water if args.water else None)
+    brain = None
+    if args.utility_ai:
+        from utility_ai import UtilityBrain
+        brain = UtilityBrain(home)
+        brain.add(dwarf)
+    history = None
+    if args.history:
+        history = WorldHistory(world, home, [dwarf, food], cursor)
+        history.take()
+        world.history = history
+    telemetry = None
+    if args.telemetry is not None:
+        from telemetry import Telemetry
+        telemetry = Telemetry(telemetry_names)
+    screen.start(world, home)
+    minimap = None
+    if args.minimap:
+        from minimap import Minimap
+        minimap = Minimap(key_event_canvas.canvas)
+        minimap.start(home)
+    spectator = None
+    if args.spectate is not None:
+        from spectator import SpectatorServer
+        spectator = SpectatorServer(home, port=args.spectate)
+    # the time spent on the greeting is not lost ticks
+    world.clock.set_period(world.speed)
+    # keys are read while waiting for the next tick too, so they keep the time they were pressed at
+    world.clock.sleep = lambda seconds: sleep_reading_keys(key_event_canvas.update, seconds)
+    quit_game = False
     while True:
         key_event_canvas.update()
-        key = key_event_canvas.stored_key
-        key_event_canvas.reset_stored_key()
-        if key in ['1', '2', '3']:
-            world.speed = world.speed_modes[int(key)]
-            world.speed_name = world.speed_modes_names[int(key)]
-        elif key == 'q':
-            break
-        cursor.move_cursor(world, home, key)
+        # the tile under the cursor may have changed since the last tick
+        cursor.move_cursor(world, home)
         dwarf.status(world, home, cursor, food)
-        if cursor.goal is None and key in ['c', 'm', 'g', 'b']:
-            cursor.create_goal(world, home, key, food)
-        if key == 'r':
-            cursor.goal = None
+        # every key pressed since the last tick in order, held arrows move the cursor at once
+        for key, times in key_event_canvas.keys.drain(['up', 'down', 'left', 'right']):
+            if cursor.build_order is not None:
+                # keys go to the open build prompt
+                cursor.type_build_order(world, key, screen)
+                continue
+            if key in ['1', '2', '3', '4']:
+                world.speed = world.speed_modes[int(key)]
+                world.speed_name = world.speed_modes_names[int(key)]
+                world.clock.set_period(world.speed)
+            elif key == 'a':
+                world.auto_work = not world.auto_work
+            elif key == 'q':
+                quit_game = True
+                break
+            elif key == 'l' and len(world.sites) > 1:
+                site = world.focus_next()
+                home, dwarf, food, cursor = site.location, site.dwarfs[0], site.food, site.cursor
+                screen.start(world, home)
+                if minimap is not None:
+                    minimap.start(home)
+                screen.show_message("Now at {}".format(site.name))
+            elif key == 'u' and history is not None:
+                tick = history.rewind()
+                screen.show_message("Back to tick {}".format(tick))
+                if brain is not None:
+                    brain.trigger_all()
+            cursor.move_cursor(world, home, key, times)
+            if key == 'd':
+                cursor.designation_corner = None if cursor.designation_corner else (cursor.y_coord, cursor.x_coord)
+            elif key in ['c', 'm', 'w'] and cursor.designation_corner is not None:
+                cursor.create_designation(home, key)
+            elif key == 'b' and tile_type(cursor.target).buildable_on:
+                cursor.open_build_order()
+            elif cursor.goal is None and key in ['c', 'm', 'g']:
+                cursor.create_goal(world, home, key, food, dwarf)
+            if key == 'x':
+                cursor.cancel_designation(home, dwarf)
+            if key == 'r':
+                cursor.drop_goal(home, dwarf)
+        if quit_game:
+            break
+        if cursor.goal is None:
+            cursor.take_build_order(world, home, dwarf)
+        if cursor.goal is None:
+            cursor.take_designated_job(world, home, dwarf)
+        if world.auto_work and brain is not None:
+            for _, action, target in brain.decide(world, world.tick, home.designations.has_job('wall')):
+                cursor.follow_decision(world, home, dwarf, food, action, target)
+        elif cursor.goal is None and world.auto_work:
+            cursor.create_auto_goal(world, home, dwarf)
         if cursor.goal is not None:
-            dwarf.dwarf_action(world, home, food, cursor, key_event_canvas)
-        clear_console()
-        home.display_grid(dwarf, food, cursor)
-        hud(world, home, dwarf, food, cursor)
-        time.sleep(world.speed)
+            dwarf.dwarf_action(world, home, food, cursor, screen)
+            if brain is not None and cursor.goal is None:
+                # done, decide what is next right away
+                brain.trigger(dwarf)
+        if home.fog is not None:
+            home.fog.update(dwarf, dwarf.y_coord, dwarf.x_coord)
+            home.fog.refresh()
+        if world.clock.should_draw():
+            screen.draw(world, home, dwarf, food, cursor)
+            if minimap is not None:
+                minimap.draw(dwarf)
+            if spectator is not None:
+                spectator.publish(world, home, dwarf, food, cursor)
+        if telemetry is not None:
+            telemetry.record(world.tick, telemetry_values(home, [dwarf], food))
+        world.clock.wait()
+        daytime = world.is_it_night_or_day
         world.world_tick()
+        if brain is not None and world.is_it_night_or_day != daytime:
+            brain.trigger_all()
+        if environment is not None:
+            environment.tick(world.tick, [(dwarf.y_coord, dwarf.x_coord), (food.y_coord, food.x_coord)])
+        if history is not None:
+            history.tick(world.tick)
+        world.catch_up_sites()
+    if spectator is not None:
+        spectator.close()
+    if telemetry is not None:
+        telemetry.export(args.telemetry)
+    return world.focused_site()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,107 @@
+from tiles import TILE_TYPES
+
+# a map file has one line per row of tiles, a character per tile, the dwarf and the food stand on empty tiles
+DWARF = 'A'
+FOOD = '♥'
+TILES = ''.join(tile.glyph for tile in TILE_TYPES)
+ENCODING = 'utf-8'
+
+
+class MapFormatError(ValueError):
+    def __init__(self, path, line, column, message):
+        super().__init__('{}:{}:{}: {}'.format(path, line, column, message))
+        self.path = path
+        self.line = line
+        self.column = column
+
+
+def row_text(line):
+    return line.rstrip('\r\n')
+
+
+def map_size(path):
+    # (height, width) of a map file, read line by line without keeping them
+    height = 0
+    width = None
+    with open(path, encoding=ENCODING) as file:
+        for line in file:
+            height += 1
+            if width is None:
+                width = len(row_text(line))
+    if not height or not width:
+        raise MapFormatError(path, 1, 1, 'the map is empty')
+    return height, width
+
+
+def read_map(path, location, empty='.'):
+    # streams rows of the file into the location, returns (y, x) of the dwarf and of the food or None,
+    # a wrong character or a row of another length stops it with a MapFormatError
+    allowed = set(TILES + DWARF + FOOD)
+    found = {DWARF: None, FOOD: None}
+    with open(path, encoding=ENCODING) as file:
+        for y, line in enumerate(file):
+            text = row_text(line)
+            if len(text) != location.width:
+                raise MapFormatError(path, y + 1, min(len(text), location.width) + 1,
+                                     'row has {} tiles, the first one has {}'.format(len(text), location.width))
+            if not allowed.issuperset(text):
+                x = next(x for x, character in enumerate(text) if character not in allowed)
+                raise MapFormatError(path, y + 1, x + 1, 'unknown tile {!r}'.format(text[x]))
+            for thing in (DWARF, FOOD):
+                x = text.find(thing)
+                if x == -1:
+                    continue
+                if found[thing] is None:
+                    found[thing] = (y, x)
+                    x = text.find(thing, x + 1)
+                if x != -1:
+                    raise MapFormatError(path, y + 1, x + 1, 'second {!r} on the map'.format(thing))
+                text = text.replace(thing, empty)
+            location.load_row(y, text)
+    return found[DWARF], found[FOOD]
+
+
+def first_empty(location, empty='.', skip=None):
+    # (y, x) of the first empty tile row by row, other than skip
+    for y in range(location.height):
+        row = location.row(y)
+        x = -1
+        while True:
+            try:
+                x = row.index(empty, x + 1)
+            except ValueError:
+                break
+            if (y, x) != skip:
+                return y, x
+    return None
+
+
+def write_map(path, location, dwarf=None, food=None, empty='.'):
+    # the location row by row in the same format, with the dwarf and the food put on it, a tile holds
+    # one character, so one that can not go on its own tile (the dwarf on the food or asleep in its bed)
+    # is written on the nearest empty tile instead, returns [(character, (y, x))] of the ones moved
+    placed = {}
+    moved = []
+    for thing, character in ((food, FOOD), (dwarf, DWARF)):
+        if thing is None:
+            continue
+        cell = (thing.y_coord, thing.x_coord)
+        if cell in placed or location.get_tile(*cell) != empty:
+            cell = location.find_empty_cell_around(*cell, skip=placed)
+            if cell is None:
+                raise ValueError('{}: no empty tile left for {!r}'.format(path, character))
+            moved.append((character, cell))
+        placed[cell] = character
+    things = {}
+    for (y, x), character in placed.items():
+        things.setdefault(y, []).append((x, character))
+    with open(path, 'w', encoding=ENCODING) as file:
+        for y in range(location.height):
+            row = location.row(y)
+            if y in things:
+                row = list(row)
+                for x, character in things[y]:
+                    row[x] = character
+            file.write(''.join(row))
+            file.write('\n')
+    return moved
@@ -0,0 +1,165 @@
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+import main
+
+# (height, width, dwarfs) of the measured worlds, from the default one up
+SCALES = [(15, 40, 1), (100, 100, 10), (300, 300, 100), (1000, 1000, 1000)]
+# the biggest world takes minutes under tracemalloc, it is only measured when asked for
+DEFAULT_MAX_TILES = 100000
+# worlds with fewer tiles are reported but not held to the per tile budget, fixed costs dominate there
+MIN_TILES_FOR_BUDGET = 10000
+# committed budget, a measurement over it fails the benchmark, raise it only on purpose
+MEMORY_BUDGET = {'grid bytes per tile': 30,
+                 'tile index bytes per tile': 75,
+                 'pathfinder bytes per tile': 425,
+                 'bytes per dwarf': 800,
+                 'bytes per cached path step': 175,
+                 'canvas bytes per key press': 1500,
+                 'canvas bytes per text field': 3000,
+                 'canvas bytes per image': 2000}
+# file allocations are made in -> subsystem they are counted for
+SUBSYSTEMS = {'main.py': 'grid',
+              # the passability rows of a grid
+              'tiles.py': 'grid',
+              'spatial_index.py': 'tile index',
+              'designations.py': 'designations',
+              'pathfinding.py': 'pathfinder'}
+
+
+def allocated_by_subsystem(snapshot, before):
+    sizes = {}
+    for stat in snapshot.compare_to(before, 'filename'):
+        name = SUBSYSTEMS.get(os.path.basename(stat.traceback[0].filename), 'other')
+        sizes[name] = sizes.get(name, 0) + stat.size_diff
+    return sizes
+
+
+def measure(step):
+    # bytes still allocated after step() by subsystem, and what step returned
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    result = step()
+    gc.collect()
+    return allocated_by_subsystem(tracemalloc.take_snapshot(), before), result
+
+
+def build_location(world):
+    location = main.Grid(world, 'home')
+    location.generate_mountain(world)
+    location.generate_trees(world)
+    return location
+
+
+def build_pathfinder(world, location):
+    location.pathfinder = main.HierarchicalPathfinder(location)
+    location.pathfinder.build_all()
+    location.path_cache = main.PathCache(location, location.pathfinder)
+
+
+def fill_path_cache(location):
+    # paths from the bed to empty tiles all over the map
+    rng = main.random.Random(0)
+    start = (location.bed_y, location.bed_x)
+    for _ in range(location.path_cache.max_size):
+        goal = None
+        while goal is None or location.get_tile(*goal) != location.empty:
+            goal = rng.randrange(location.height), rng.randrange(location.width)
+        location.path_cache.find_path(start, [goal])
+    # cached paths are as long as the map is big, so they are counted by step
+    return sum(len(path) for path, _ in location.path_cache.entries.values() if path is not None)
+
+
+def measure_world(height, width, dwarfs):
+    results = {}
+    world = main.World('benchmark-world', width, height)
+    tiles = height * width
+    sizes, location = measure(lambda: build_location(world))
+    results['grid bytes per tile'] = sizes.get('grid', 0) / tiles
+    results['tile index bytes per tile'] = sizes.get('tile index', 0) / tiles
+    sizes, _ = measure(lambda: build_pathfinder(world, location))
+    results['pathfinder bytes per tile'] = sizes.get('pathfinder', 0) / tiles
+    sizes, _ = measure(lambda: [main.Dwarf(location, 'dwarf {}'.format(i)) for i in range(dwarfs)])
+    results['bytes per dwarf'] = sum(sizes.values()) / dwarfs
+    sizes, steps = measure(lambda: fill_path_cache(location))
+    results['bytes per cached path step'] = sum(sizes.values()) / max(steps, 1)
+    return results
+
+
+def measure_canvas(count=1000):
+    # graphics.Canvas keeps unhandled key presses, text fields and every image it made, it needs a
+    # display to exist
+    try:
+        from graphics import Canvas
+        canvas = Canvas()
+    except Exception as error:
+        return None, error
+    results = {}
+
+    class KeyPress(object):
+        def __init__(self, keysym):
+            self.keysym = keysym
+
+    sizes, _ = measure(lambda: [canvas._Canvas__key_pressed(KeyPress('a')) for _ in range(count)])
+    results['canvas bytes per key press'] = sum(sizes.values()) / count
+    sizes, _ = measure(lambda: [canvas.create_text_field('field {}'.format(i), Canvas.BOTTOM)
+                                for i in range(count // 10)])
+    results['canvas bytes per text field'] = sum(sizes.values()) / (count // 10)
+    # one pixel images, tk keeps the pixels outside of python, what the canvas holds on to is counted
+    sizes, _ = measure(lambda: [canvas.create_bitmap(0, 0, 1, 1) for _ in range(count // 10)])
+    results['canvas bytes per image'] = sum(sizes.values()) / (count // 10)
+    canvas.main_window.destroy()
+    return results, None
+
+
+def over_budget(name, value):
+    return name in MEMORY_BUDGET and value > MEMORY_BUDGET[name]
+
+
+def report(title, results, checked):
+    print(title, flush=True)
+    failures = []
+    for name, value in results.items():
+        mark = ''
+        if checked and over_budget(name, value):
+            failures.append('{}: {} {:.1f} > {}'.format(title, name, value, MEMORY_BUDGET[name]))
+            mark = '  OVER BUDGET ({})'.format(MEMORY_BUDGET[name])
+        print('    {:<30} {:>10.1f}{}'.format(name, value, mark))
+    return failures
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description='Memory use of Karel Fortress worlds by subsystem')
+    parser.add_argument('--max-tiles', type=int, default=DEFAULT_MAX_TILES,
+                        help='skip worlds bigger than this, 0 measures all of them')
+    parser.add_argument('--no-canvas', action='store_true', help='do not measure the tkinter canvas')
+    args = parser.parse_args()
+    tracemalloc.start()
+    failures = []
+    for height, width, dwarfs in SCALES:
+        if args.max_tiles and height * width > args.max_tiles:
+            continue
+        results = measure_world(height, width, dwarfs)
+        failures += report('{}x{} world, {} dwarfs'.format(width, height, dwarfs), results,
+                           height * width >= MIN_TILES_FOR_BUDGET)
+    if not args.no_canvas:
+        results, error = measure_canvas()
+        if results is None:
+            print('canvas skipped:', error)
+        else:
+            failures += report('canvas', results, True)
+    print('peak traced memory: {:.1f} MB'.format(tracemalloc.get_traced_memory()[1] / 2 ** 20))
+    tracemalloc.stop()
+    if failures:
+        print('memory budget exceeded:')
+        for failure in failures:
+            print('    ' + failure)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_benchmark())
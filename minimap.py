@@ -0,0 +1,85 @@
+from collections import defaultdict
+
+from tiles import TILE_TYPES, UNKNOWN_TILE
+
+# pixel of a tile still under the fog
+FOG_COLOR = '#000000'
+DWARF_COLOR = '#ffeb3b'
+# outline of the part of the map the screen shows
+VIEW_COLOR = '#ffffff'
+
+
+class Minimap(object):
+    # the whole location one pixel per tile in a single PhotoImage of the tkinter window, every row is
+    # kept as the text tk reads pixels from, starting puts all of them in one call, after that only
+    # the rows with changed tiles are made again and put, neighbouring rows together
+
+    def __init__(self, canvas, x=0, y=0):
+        self.canvas = canvas
+        self.x = x
+        self.y = y
+        # glyph -> '#rrggbb'
+        self.colors = defaultdict(lambda: UNKNOWN_TILE.color)
+        self.colors.update({tile.glyph: tile.color for tile in TILE_TYPES})
+        self.colors[' '] = FOG_COLOR
+        self.location = None
+        self.image_item = None
+        self.image = None
+        self.view_item = None
+        self.dwarf_item = None
+        # pixel data of every row as last put into the image
+        self.rows = []
+        # rows changed since the last frame
+        self.dirty = set()
+
+    def start(self, location):
+        if self.location is not None:
+            self.location.tile_listeners.remove(self.on_tile_change)
+            if self.location.fog is not None:
+                self.location.fog.reveal_listeners.remove(self.on_tile_change)
+            for item in (self.image_item, self.view_item, self.dwarf_item):
+                self.canvas.delete(item)
+            # the canvas keeps every image it made, the old map would stay in memory
+            self.canvas._image_gb_protection.pop(self.image_item, None)
+        self.location = location
+        location.tile_listeners.append(self.on_tile_change)
+        if location.fog is not None:
+            location.fog.reveal_listeners.append(self.on_tile_change)
+        self.canvas.config(width=self.x + location.width, height=self.y + location.height)
+        self.canvas.main_window.geometry("{}x{}".format(self.x + location.width, self.y + location.height))
+        self.image_item, self.image = self.canvas.create_bitmap(self.x, self.y, location.width, location.height)
+        self.rows = [self.pixel_row(y) for y in range(location.height)]
+        self.image.put(' '.join(self.rows))
+        self.dirty.clear()
+        self.view_item = self.canvas.create_rectangle(0, 0, 0, 0, VIEW_COLOR)
+        self.canvas.set_fill_color(self.view_item, '')
+        self.dwarf_item = self.canvas.create_rectangle(0, 0, 0, 0, DWARF_COLOR)
+
+    def pixel_row(self, y):
+        location = self.location
+        if location.fog is None:
+            tiles = location.row(y)
+        else:
+            tiles = [location.shown_tile(y, x) for x in range(location.width)]
+        return '{' + ' '.join(map(self.colors.__getitem__, tiles)) + '}'
+
+    def on_tile_change(self, y, x, tile):
+        self.dirty.add(y)
+
+    def draw(self, dwarf):
+        # runs of neighbouring changed rows go into the image with one put each
+        rows = sorted(self.dirty)
+        self.dirty.clear()
+        start = 0
+        for i, y in enumerate(rows):
+            self.rows[y] = self.pixel_row(y)
+            if i + 1 == len(rows) or rows[i + 1] != y + 1:
+                top = rows[start]
+                self.image.put(' '.join(self.rows[top:y + 1]), to=(0, top))
+                start = i + 1
+        location = self.location
+        self.canvas.coords(self.view_item, self.x + location.view_left, self.y + location.view_top,
+                           self.x + location.view_left + location.view_width,
+                           self.y + location.view_top + location.view_height)
+        self.canvas.coords(self.dwarf_item, self.x + dwarf.x_coord - 1, self.y + dwarf.y_coord - 1,
+                           self.x + dwarf.x_coord + 1, self.y + dwarf.y_coord + 1)
@@ -0,0 +1,540 @@
+import heapq
+from collections import OrderedDict
+
+# size of a side of a square cluster used by the hierarchical planner
+CLUSTER_SIZE = 10
+# the abstract graph is already an approximation, a slightly greedy search over it
+# expands far fewer entrances on long trips for a path only a few steps longer
+ABSTRACT_HEURISTIC_WEIGHT = 1.3
+# number of paths kept by the shared path cache
+PATH_CACHE_SIZE = 256
+# entrances a search in an endless world may look at before it gives up, there is no edge to stop it
+ENDLESS_NODE_BUDGET = 1000
+STEPS = ((-1, 0), (0, 1), (1, 0), (0, -1))
+INFINITY = float('inf')
+
+
+def manhattan(a, b):
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def reconstruct(came_from, cell):
+    path = []
+    while came_from[cell] is not None:
+        path.append(cell)
+        cell = came_from[cell]
+    path.reverse()
+    return path
+
+
+def astar(is_walkable, start, goals, bounds):
+    # plain grid A*, bounds are (min_y, min_x, max_y, max_x) inclusive,
+    # returns cells to walk through (start excluded) or None if no goal can be reached
+    goals = set(goals)
+    if start in goals:
+        return []
+    if not goals:
+        return None
+    min_y, min_x, max_y, max_x = bounds
+    came_from = {start: None}
+    cost = {start: 0}
+    counter = 0
+    heuristic = min(manhattan(start, goal) for goal in goals)
+    queue = [(heuristic, heuristic, counter, start)]
+    while queue:
+        estimate, heuristic, _, cell = heapq.heappop(queue)
+        if cell in goals:
+            return reconstruct(came_from, cell)
+        if estimate - heuristic > cost[cell]:
+            continue
+        y, x = cell
+        for dy, dx in STEPS:
+            ny, nx = y + dy, x + dx
+            if ny < min_y or ny > max_y or nx < min_x or nx > max_x:
+                continue
+            neighbour = (ny, nx)
+            new_cost = cost[cell] + 1
+            if neighbour in cost and cost[neighbour] <= new_cost:
+                continue
+            if not is_walkable(ny, nx):
+                continue
+            cost[neighbour] = new_cost
+            came_from[neighbour] = cell
+            counter += 1
+            heuristic = min(manhattan(neighbour, goal) for goal in goals)
+            heapq.heappush(queue, (new_cost + heuristic, heuristic, counter, neighbour))
+    return None
+
+
+def bfs_tree(is_walkable, start, bounds):
+    # distances and parents of every walkable cell inside bounds reachable from start
+    min_y, min_x, max_y, max_x = bounds
+    distances = {start: 0}
+    parents = {start: None}
+    frontier = [start]
+    while frontier:
+        next_frontier = []
+        for y, x in frontier:
+            for dy, dx in STEPS:
+                ny, nx = y + dy, x + dx
+                if ny < min_y or ny > max_y or nx < min_x or nx > max_x:
+                    continue
+                if (ny, nx) in distances or not is_walkable(ny, nx):
+                    continue
+                distances[(ny, nx)] = distances[(y, x)] + 1
+                parents[(ny, nx)] = (y, x)
+                next_frontier.append((ny, nx))
+        frontier = next_frontier
+    return distances, parents
+
+
+class HierarchicalPathfinder(object):
+    # HPA*: the map is cut into clusters, walkable openings on cluster borders become entrances
+    # and the abstract graph of entrances is searched first, then refined locally cluster by cluster,
+    # clusters are only worked out when a search first reaches them, node_budget caps the entrances
+    # one search looks at, None for no cap
+
+    def __init__(self, location, cluster_size=CLUSTER_SIZE, node_budget=None):
+        self.location = location
+        self.node_budget = node_budget
+        # the check of the location itself, bit masks on finite maps
+        self.is_walkable = location.is_walkable
+        self.cluster_size = cluster_size
+        self.clusters_y = (location.height + cluster_size - 1) // cluster_size
+        self.clusters_x = (location.width + cluster_size - 1) // cluster_size
+        # border key -> list of (cell, cell) pairs connecting two neighbouring clusters
+        self.border_links = {}
+        # entrance cell -> set of entrance cells on the other side of the border
+        self.inter_edges = {}
+        # cluster -> {entrance cell: {entrance cell: cached path inside cluster}}
+        self.intra_edges = {}
+        location.tile_listeners.append(self.on_tile_change)
+
+    def cluster_of(self, cell):
+        return cell[0] // self.cluster_size, cell[1] // self.cluster_size
+
+    def cluster_bounds(self, cluster):
+        min_y = cluster[0] * self.cluster_size
+        min_x = cluster[1] * self.cluster_size
+        max_y = min(min_y + self.cluster_size, self.location.height) - 1
+        max_x = min(min_x + self.cluster_size, self.location.width) - 1
+        return min_y, min_x, max_y, max_x
+
+    def borders_of(self, cluster):
+        cy, cx = cluster
+        borders = []
+        if cx > 0:
+            borders.append(((cy, cx - 1), cluster))
+        if cy > 0:
+            borders.append(((cy - 1, cx), cluster))
+        if cx + 1 < self.clusters_x:
+            borders.append((cluster, (cy, cx + 1)))
+        if cy + 1 < self.clusters_y:
+            borders.append((cluster, (cy + 1, cx)))
+        return borders
+
+    def build_all(self):
+        # for maps small enough to be worked out up front
+        for cy in range(self.clusters_y):
+            for cx in range(self.clusters_x):
+                self.ensure_cluster((cy, cx))
+
+    def ensure_cluster(self, cluster):
+        if cluster in self.intra_edges:
+            return
+        for first, second in self.borders_of(cluster):
+            if (first, second) not in self.border_links:
+                self.build_border(first, second)
+        self.build_intra_edges(cluster)
+
+    def build_border(self, first, second):
+        # first is always the upper or the left cluster
+        for a, b in self.border_links.pop((first, second), []):
+            self.inter_edges[a].discard(b)
+            self.inter_edges[b].discard(a)
+            if not self.inter_edges[a]:
+                del self.inter_edges[a]
+            if not self.inter_edges[b]:
+                del self.inter_edges[b]
+        min_y, min_x, max_y, max_x = self.cluster_bounds(first)
+        if first[0] == second[0]:
+            pairs = [((y, max_x), (y, max_x + 1)) for y in range(min_y, max_y + 1)]
+        else:
+            pairs = [((max_y, x), (max_y + 1, x)) for x in range(min_x, max_x + 1)]
+        links = []
+        segment = []
+        for pair in pairs + [None]:
+            if pair is not None and self.is_walkable(*pair[0]) and self.is_walkable(*pair[1]):
+                segment.append(pair)
+            elif segment:
+                # one entrance in the middle of every continuous opening
+                links.append(segment[len(segment) // 2])
+                segment = []
+        for a, b in links:
+            self.inter_edges.setdefault(a, set()).add(b)
+            self.inter_edges.setdefault(b, set()).add(a)
+        self.border_links[(first, second)] = links
+
+    def entrances_of(self, cluster):
+        entrances = set()
+        for key in self.borders_of(cluster):
+            for a, b in self.border_links.get(key, []):
+                entrances.add(a if self.cluster_of(a) == cluster else b)
+        return entrances
+
+    def build_intra_edges(self, cluster):
+        bounds = self.cluster_bounds(cluster)
+        entrances = self.entrances_of(cluster)
+        edges = {}
+        for entrance in entrances:
+            _, parents = bfs_tree(self.is_walkable, entrance, bounds)
+            edges[entrance] = {other: reconstruct(parents, other) for other in entrances
+                               if other != entrance and other in parents}
+        self.intra_edges[cluster] = edges
+
+    def on_tile_change(self, y, x, tile):
+        # only the borders of the touched cluster and the neighbours sharing them need an update,
+        # parts never worked out yet stay that way
+        cluster = self.cluster_of((y, x))
+        touched = {cluster}
+        for first, second in self.borders_of(cluster):
+            if (first, second) in self.border_links:
+                self.build_border(first, second)
+                touched.update((first, second))
+        for touched_cluster in touched:
+            if touched_cluster in self.intra_edges:
+                self.build_intra_edges(touched_cluster)
+
+    def forget_area(self, min_y, min_x, max_y, max_x):
+        # drops what was worked out about the clusters over an area, with their borders and the
+        # neighbours that had entrances on them, a later search works them out again
+        clusters = {(cy, cx) for cy in range(min_y // self.cluster_size, max_y // self.cluster_size + 1)
+                    for cx in range(min_x // self.cluster_size, max_x // self.cluster_size + 1)}
+        for cluster in clusters:
+            for first, second in self.borders_of(cluster):
+                for a, b in self.border_links.pop((first, second), []):
+                    for one, other in ((a, b), (b, a)):
+                        edges = self.inter_edges.get(one)
+                        if edges is not None:
+                            edges.discard(other)
+                            if not edges:
+                                del self.inter_edges[one]
+                self.intra_edges.pop(first, None)
+                self.intra_edges.pop(second, None)
+            self.intra_edges.pop(cluster, None)
+
+    def find_path(self, start, goals):
+        goals = [goal for goal in goals if self.is_walkable(*goal)]
+        if not goals:
+            return None
+        if start in goals:
+            return []
+        start_cluster = self.cluster_of(start)
+        # short trips inside one cluster do not need the abstract graph
+        if any(self.cluster_of(goal) == start_cluster for goal in goals):
+            path = astar(self.is_walkable, start, goals, self.cluster_bounds(start_cluster))
+            if path is not None:
+                return path
+        start_cluster = self.cluster_of(start)
+        self.ensure_cluster(start_cluster)
+        _, start_parents = bfs_tree(self.is_walkable, start, self.cluster_bounds(start_cluster))
+        # entrance of a goal cluster -> cheapest path from it to a goal
+        goal_paths = {}
+        for goal in goals:
+            goal_cluster = self.cluster_of(goal)
+            self.ensure_cluster(goal_cluster)
+            _, goal_parents = bfs_tree(self.is_walkable, goal, self.cluster_bounds(goal_cluster))
+            for entrance in self.entrances_of(goal_cluster):
+                if entrance not in goal_parents:
+                    continue
+                path = reconstruct(goal_parents, entrance)[:-1][::-1] + [goal] if entrance != goal else []
+                if entrance not in goal_paths or len(path) < len(goal_paths[entrance]):
+                    goal_paths[entrance] = path
+        if not goal_paths:
+            # the goals are shut in their clusters, no search from outside gets to them
+            return None
+        came_from = {}
+        cost = {}
+        queue = []
+        counter = 0
+        for entrance in self.entrances_of(start_cluster):
+            if entrance in start_parents:
+                came_from[entrance] = None
+                cost[entrance] = len(reconstruct(start_parents, entrance))
+                counter += 1
+                heuristic = ABSTRACT_HEURISTIC_WEIGHT * min(manhattan(entrance, goal) for goal in goals)
+                heapq.heappush(queue, (cost[entrance] + heuristic, heuristic, counter, entrance, cost[entrance]))
+        best_goal_cost = float('inf')
+        best_last = None
+        expanded = 0
+        while queue:
+            estimate, _, _, node, node_cost = heapq.heappop(queue)
+            if estimate >= best_goal_cost:
+                break
+            if node_cost > cost[node]:
+                # stale entry, the node was reached cheaper in the meantime
+                continue
+            expanded += 1
+            if self.node_budget is not None and expanded > self.node_budget:
+                break
+            self.ensure_cluster(self.cluster_of(node))
+            if node in goal_paths and cost[node] + len(goal_paths[node]) < best_goal_cost:
+                best_goal_cost = cost[node] + len(goal_paths[node])
+                best_last = node
+            neighbours = [(other, len(path)) for other, path in
+                          self.intra_edges[self.cluster_of(node)].get(node, {}).items()]
+            neighbours += [(other, 1) for other in self.inter_edges.get(node, ())]
+            for neighbour, step_cost in neighbours:
+                new_cost = cost[node] + step_cost
+                if neighbour in cost and cost[neighbour] <= new_cost:
+                    continue
+                cost[neighbour] = new_cost
+                came_from[neighbour] = node
+                counter += 1
+                heuristic = ABSTRACT_HEURISTIC_WEIGHT * min(manhattan(neighbour, goal) for goal in goals)
+                # ties go to the node closer to the goal, keeps the search narrow
+                heapq.heappush(queue, (new_cost + heuristic, heuristic, counter, neighbour, new_cost))
+        if best_last is None:
+            return None
+        return self.refine(start_parents, came_from, best_last, goal_paths[best_last])
+
+    def refine(self, start_parents, came_from, last, goal_path):
+        # stitch cached pieces together: start to first entrance, entrance hops, last entrance to goal
+        chain = []
+        node = last
+        while node is not None:
+            chain.append(node)
+            node = came_from[node]
+        chain.reverse()
+        path = reconstruct(start_parents, chain[0])
+        for current, following in zip(chain, chain[1:]):
+            if self.cluster_of(current) != self.cluster_of(following):
+                path.append(following)
+            else:
+                path += self.intra_edges[self.cluster_of(current)][current][following]
+        return path + goal_path
+
+
+class PathCache(object):
+    # bounded LRU of planned paths shared by every dwarf of a location, a found path is dropped
+    # as soon as any tile on it changes, a failed search only lives until the grid changes at all
+
+    def __init__(self, location, pathfinder, max_size=PATH_CACHE_SIZE):
+        self.location = location
+        self.pathfinder = pathfinder
+        self.max_size = max_size
+        # (start, goals) -> (path or None, grid version when it was computed)
+        self.entries = OrderedDict()
+        # cell -> keys of cached paths going through it
+        self.cells = {}
+        self.hits = 0
+        self.misses = 0
+        location.tile_listeners.append(self.on_tile_change)
+
+    def find_path(self, start, goals):
+        key = (start, tuple(sorted(goals)))
+        if key in self.entries:
+            path, version = self.entries[key]
+            if path is not None or version == self.location.version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return None if path is None else list(path)
+            self.discard(key)
+        self.misses += 1
+        path = self.pathfinder.find_path(start, goals)
+        self.entries[key] = (None if path is None else tuple(path), self.location.version)
+        if path is not None:
+            for cell in [start] + path:
+                self.cells.setdefault(cell, set()).add(key)
+        if len(self.entries) > self.max_size:
+            self.discard(next(iter(self.entries)))
+        return path
+
+    def discard(self, key):
+        path, _ = self.entries.pop(key)
+        if path is None:
+            return
+        for cell in (key[0],) + path:
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def on_tile_change(self, y, x, tile):
+        for key in list(self.cells.get((y, x), ())):
+            self.discard(key)
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class IncrementalSearch(object):
+    # D* Lite: searches from the goals back to the start and keeps g and rhs of every cell it has
+    # looked at, when the start moves only the keys shift by km and when tiles change only the cells
+    # next to them are looked at again, so fixing a path costs as much as the change, not the map
+
+    def __init__(self, is_walkable, start, goals, bounds):
+        self.is_walkable = is_walkable
+        self.bounds = bounds
+        self.start = start
+        # start the keys were made for, km grows by how far the start moved since
+        self.last = start
+        self.km = 0
+        self.goals = frozenset(goals)
+        # cost to reach a goal, as settled and as one look ahead says, missing is infinite
+        self.g = {}
+        self.rhs = {}
+        # (key, cell), a cell's entry is only good while queued still has its key
+        self.queue = []
+        self.queued = {}
+        # tiles changed since the last repair that this search has looked at
+        self.changed = set()
+        self.expanded = 0
+        for goal in self.goals:
+            self.rhs[goal] = 0
+            self.enqueue(goal)
+
+    def key(self, cell):
+        best = min(self.g.get(cell, INFINITY), self.rhs.get(cell, INFINITY))
+        return best + abs(cell[0] - self.start[0]) + abs(cell[1] - self.start[1]) + self.km, best
+
+    def enqueue(self, cell):
+        # queued while g and rhs disagree, taken out when they agree again
+        if self.g.get(cell, INFINITY) != self.rhs.get(cell, INFINITY):
+            key = self.key(cell)
+            self.queued[cell] = key
+            heapq.heappush(self.queue, (key, cell))
+        else:
+            self.queued.pop(cell, None)
+
+    def neighbours(self, cell):
+        min_y, min_x, max_y, max_x = self.bounds
+        y, x = cell
+        return [(ny, nx) for ny, nx in ((y - 1, x), (y, x + 1), (y + 1, x), (y, x - 1))
+                if min_y <= ny <= max_y and min_x <= nx <= max_x]
+
+    def can_leave(self, cell):
+        # nobody walks through a blocked tile, only the dwarf's own one counts as free
+        return cell == self.start or self.is_walkable(*cell)
+
+    def look_ahead(self, cell):
+        # rhs worked out again from the neighbours
+        if cell in self.goals:
+            return 0
+        rhs = INFINITY
+        if self.can_leave(cell):
+            g = self.g
+            for neighbour in self.neighbours(cell):
+                cost = g.get(neighbour, INFINITY) + 1
+                if cost < rhs and self.is_walkable(*neighbour):
+                    rhs = cost
+        return rhs
+
+    def on_tile_change(self, y, x, tile):
+        # a cell never looked at can not be on any path of this search
+        if (y, x) in self.rhs:
+            self.changed.add((y, x))
+
+    def move_to(self, start):
+        self.km += manhattan(self.last, start)
+        self.last = start
+        if start != self.start:
+            old, self.start = self.start, start
+            # the old and new start may be blocked tiles, whether they can be left has changed
+            for cell in (old, start):
+                if cell in self.rhs:
+                    self.changed.add(cell)
+
+    def compute(self):
+        g, rhs, queue, queued = self.g, self.rhs, self.queue, self.queued
+        for cell in self.changed:
+            for neighbour in [cell] + self.neighbours(cell):
+                rhs[neighbour] = self.look_ahead(neighbour)
+                self.enqueue(neighbour)
+        self.changed.clear()
+        start = self.start
+        while queue:
+            key, cell = queue[0]
+            if queued.get(cell) != key:
+                heapq.heappop(queue)
+                continue
+            if key >= self.key(start) and rhs.get(start, INFINITY) <= g.get(start, INFINITY):
+                break
+            heapq.heappop(queue)
+            new_key = self.key(cell)
+            if key < new_key:
+                queued[cell] = new_key
+                heapq.heappush(queue, (new_key, cell))
+                continue
+            del queued[cell]
+            self.expanded += 1
+            neighbours = self.neighbours(cell)
+            if g.get(cell, INFINITY) > rhs[cell]:
+                # cheaper than known, the neighbours may get here cheaper too
+                cost = g[cell] = rhs[cell]
+                if not self.is_walkable(*cell):
+                    continue
+                for neighbour in neighbours:
+                    if not self.can_leave(neighbour):
+                        # blocked, but kept so opening it up later is noticed
+                        rhs.setdefault(neighbour, INFINITY)
+                    elif cost + 1 < rhs.get(neighbour, INFINITY) and neighbour not in self.goals:
+                        rhs[neighbour] = cost + 1
+                        self.enqueue(neighbour)
+            else:
+                # dearer than known, the neighbours that came through here look again
+                old = g.pop(cell)
+                for neighbour in neighbours + [cell]:
+                    if rhs.get(neighbour) == old + 1 or neighbour == cell:
+                        rhs[neighbour] = self.look_ahead(neighbour)
+                    self.enqueue(neighbour)
+
+    def path(self):
+        # cells to walk through (start excluded) or None if no goal can be reached
+        self.compute()
+        g = self.g
+        cell = self.start
+        # the start itself may be left with only its rhs right, that is enough to go by
+        if self.rhs.get(cell, INFINITY) == INFINITY:
+            return None
+        path = []
+        while cell not in self.goals:
+            cell = min((neighbour for neighbour in self.neighbours(cell) if self.is_walkable(*neighbour)),
+                       key=lambda neighbour: g.get(neighbour, INFINITY))
+            path.append(cell)
+        return path
+
+
+class PathRepair(object):
+    # one IncrementalSearch per dwarf of a finite location kept while its goals stay the same,
+    # tile changes go to the searches that looked at them and paths are fixed instead of planned again
+
+    def __init__(self, location):
+        self.location = location
+        self.bounds = (0, 0, location.height - 1, location.width - 1)
+        # owner -> IncrementalSearch
+        self.searches = {}
+        location.tile_listeners.append(self.on_tile_change)
+
+    def find_path(self, owner, start, goals):
+        search = self.searches.get(owner)
+        if search is None or search.goals != frozenset(goals):
+            search = IncrementalSearch(self.location.is_walkable, start, goals, self.bounds)
+            self.searches[owner] = search
+        else:
+            search.move_to(start)
+        return search.path()
+
+    def is_stale(self, owner):
+        # tiles the owner's search looked at changed, its path may be blocked or no longer the shortest
+        search = self.searches.get(owner)
+        return search is not None and bool(search.changed)
+
+    def forget(self, owner):
+        self.searches.pop(owner, None)
+
+    def on_tile_change(self, y, x, tile):
+        for search in self.searches.values():
+            search.on_tile_change(y, x, tile)
@@ -0,0 +1,133 @@
+import heapq
+
+from pathfinding import STEPS, manhattan
+
+# route steps a dwarf plans around the others at once, planning cost only depends on it
+COOPERATIVE_WINDOW = 8
+# ticks the space-time search may use to get through a window, the rest go to waiting
+WINDOW_TICKS = 2 * COOPERATIVE_WINDOW
+
+
+class ReservationTable(object):
+    # (y, x, tick) slots taken by moving dwarfs of a location, every dwarf plans the next few
+    # steps of its route around slots others already took, and then takes its own slots,
+    # the tile a dwarf ends on stays its own until it plans again, so idle and arrived dwarfs
+    # are walked around however long they stand there
+
+    def __init__(self, window=COOPERATIVE_WINDOW):
+        self.window = window
+        # (y, x, tick) -> dwarf
+        self.slots = {}
+        # dwarf -> its slots, so they can be given back when it plans again
+        self.taken = {}
+        # (y, x) -> (dwarf, tick it stands there from)
+        self.standing = {}
+        # dwarf -> (y, x) it stands on
+        self.stands = {}
+
+    def owner(self, y, x, tick):
+        owner = self.slots.get((y, x, tick))
+        if owner is None:
+            standing = self.standing.get((y, x))
+            if standing is not None and tick >= standing[1]:
+                owner = standing[0]
+        return owner
+
+    def is_free(self, agent, y, x, tick):
+        owner = self.owner(y, x, tick)
+        return owner is None or owner is agent
+
+    def swaps_with_other(self, agent, cell, neighbour, tick):
+        # two dwarfs trading places walk through each other in the middle of the tick
+        other = self.owner(neighbour[0], neighbour[1], tick - 1)
+        return other is not None and other is not agent and \
+            self.owner(cell[0], cell[1], tick) is other
+
+    def stays_free(self, agent, y, x, tick):
+        # a dwarf stopping here at tick is not walked into by the plans the others already made
+        return all(self.is_free(agent, y, x, tick + i) for i in range(WINDOW_TICKS + 1))
+
+    def release(self, agent):
+        for key in self.taken.pop(agent, ()):
+            if self.slots.get(key) is agent:
+                del self.slots[key]
+        cell = self.stands.pop(agent, None)
+        if cell is not None and self.standing[cell][0] is agent:
+            del self.standing[cell]
+
+    def stand(self, agent, y, x, tick):
+        # a dwarf not walking anywhere keeps the tile it is on from tick on
+        if self.stands.get(agent) == (y, x) and agent not in self.taken:
+            return
+        self.release(agent)
+        self.take_stand(agent, y, x, tick)
+
+    def take_stand(self, agent, y, x, tick):
+        if (y, x) not in self.standing:
+            self.standing[(y, x)] = (agent, tick)
+            self.stands[agent] = (y, x)
+
+    def reserve(self, agent, steps, tick):
+        # steps[i] is where the dwarf stands at tick + i, it stands on the last one after that
+        self.release(agent)
+        keys = [(y, x, tick + i) for i, (y, x) in enumerate(steps)]
+        for key in keys:
+            self.slots.setdefault(key, agent)
+        self.taken[agent] = keys
+        last_y, last_x = steps[-1]
+        self.take_stand(agent, last_y, last_x, tick + len(steps))
+
+    def plan(self, agent, is_walkable, start, route, tick, bounds):
+        # space-time A* from start towards route[window - 1] around taken slots, waiting is a step too,
+        # bounds are (min_y, min_x, max_y, max_x) inclusive like in astar,
+        # returns (cells for ticks tick, tick + 1, ..., route cells reached or 0 if it fell short)
+        target_index = min(self.window, len(route)) - 1
+        target = route[target_index]
+        min_y, min_x, max_y, max_x = bounds
+        start_state = (start, 0)
+        came_from = {start_state: None}
+        counter = 0
+        heuristic = manhattan(start, target)
+        best = (heuristic, start_state)
+        queue = [(heuristic, heuristic, counter, start_state)]
+        while queue:
+            _, heuristic, _, state = heapq.heappop(queue)
+            cell, elapsed = state
+            # the steps end where the dwarf can stay
+            if cell == target:
+                if self.stays_free(agent, cell[0], cell[1], tick + elapsed - 1):
+                    best = (0, state)
+                    break
+                # a dwarf at its goal stops there, it does not step off to let others by
+                continue
+            if (heuristic, elapsed) < (best[0], best[1][1]) and \
+                    self.stays_free(agent, cell[0], cell[1], tick + elapsed - 1):
+                best = (heuristic, state)
+            if elapsed == WINDOW_TICKS:
+                continue
+            for dy, dx in STEPS + ((0, 0),):
+                neighbour = (cell[0] + dy, cell[1] + dx)
+                next_state = (neighbour, elapsed + 1)
+                if next_state in came_from:
+                    continue
+                if neighbour != cell and (neighbour[0] < min_y or neighbour[0] > max_y or neighbour[1] < min_x or
+                                          neighbour[1] > max_x or not is_walkable(*neighbour)):
+                    continue
+                if not self.is_free(agent, neighbour[0], neighbour[1], tick + elapsed) or \
+                        self.swaps_with_other(agent, cell, neighbour, tick + elapsed):
+                    continue
+                came_from[next_state] = state
+                counter += 1
+                heuristic = manhattan(neighbour, target)
+                heapq.heappush(queue, (elapsed + 1 + heuristic, heuristic, counter, next_state))
+        state = best[1]
+        steps = []
+        while came_from[state] is not None:
+            steps.append(state[0])
+            state = came_from[state]
+        steps.reverse()
+        if not steps:
+            # boxed in for now, stand still
+            steps = [start]
+        self.reserve(agent, steps, tick)
+        return steps, (target_index + 1 if best[0] == 0 else 0)
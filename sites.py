@@ -0,0 +1,125 @@
+from tiles import tile_type
+
+# ticks between two catch ups of a site nobody is looking at
+LOD_INTERVAL = 100
+# ticks an unwatched dwarf needs for one tree or rock, walking there included
+WORK_CYCLE_TICKS = 20
+# needs are counted in tenths, so catching up is exact however the ticks are split
+FULL_STOMACH = 1000
+EAT_BELOW = 500
+
+
+class Site(object):
+    # a location with the dwarfs, food and cursor on it, the focused site is simulated tick by tick,
+    # the others only keep a SiteSummary brought up to date now and then, focusing a site again
+    # catches it up to the current tick and writes the summary back into the location
+
+    def __init__(self, name, location, dwarfs, food, cursor):
+        self.name = name
+        self.location = location
+        self.dwarfs = dwarfs
+        self.food = food
+        self.cursor = cursor
+        # None while the site is focused
+        self.summary = None
+
+    def unfocus(self, world):
+        self.summary = SiteSummary(self, world.tick, world.auto_work)
+        # the summary clears the paths when the site is focused again, searches for them are of no use
+        for dwarf in self.dwarfs:
+            dwarf.forget_route(self.location)
+
+    def catch_up(self, tick):
+        self.summary.advance(tick)
+
+    def focus(self, world):
+        self.summary.advance(world.tick)
+        self.summary.apply(self)
+        self.summary = None
+
+
+class SiteSummary(object):
+    # needs, food and gathered resources of an unfocused site as plain numbers, advance(a) then
+    # advance(b) ends the same as advance(b) alone, eating and work happen in tick order
+
+    def __init__(self, site, tick, auto_work):
+        location = site.location
+        self.tick = tick
+        self.auto_work = auto_work
+        self.hunger = [int(round(dwarf.hunger * 10)) for dwarf in site.dwarfs]
+        self.hp = [dwarf.hp for dwarf in site.dwarfs]
+        # ticks each dwarf has worked on its current tree or rock
+        self.progress = [0] * len(site.dwarfs)
+        # per dwarf (trees chopped, rocks mined) since the summary was made
+        self.gathered = [[0, 0] for _ in site.dwarfs]
+        self.food = site.food.amount
+        self.left = [location.tile_index.count(location.tree), location.tile_index.count(location.rock)]
+
+    def advance(self, tick):
+        ticks = tick - self.tick
+        if ticks <= 0:
+            return
+        self.eat(ticks)
+        if self.auto_work:
+            self.work(ticks)
+        self.tick = tick
+
+    def eat(self, ticks):
+        # every tick the stomach empties by one tenth, a dwarf below EAT_BELOW eats when there is food,
+        # meals are handed out in the order they happen, one that never eats goes hungry and loses hp
+        hunger = self.hunger
+        done = [0] * len(hunger)
+        while True:
+            # tick after the start at which each dwarf eats next
+            meals = [(done[i] + max(hunger[i] - EAT_BELOW + 1, 1), i) for i in range(len(hunger))]
+            meals = [meal for meal in meals if meal[0] <= ticks]
+            if not meals or self.food <= 0:
+                break
+            at, i = min(meals)
+            hunger[i] = FULL_STOMACH
+            done[i] = at
+            self.food -= 1
+        for i in range(len(hunger)):
+            left = ticks - done[i]
+            self.hp[i] -= max(0, left - max(hunger[i], 0))
+            hunger[i] -= left
+
+    def work(self, ticks):
+        # finished cycles of all dwarfs in tick order, trees first like create_auto_goal
+        finished = []
+        for i, progress in enumerate(self.progress):
+            first = WORK_CYCLE_TICKS - progress
+            finished.extend((at, i) for at in range(first, ticks + 1, WORK_CYCLE_TICKS))
+            self.progress[i] = (progress + ticks) % WORK_CYCLE_TICKS
+        for _, i in sorted(finished):
+            for kind in (0, 1):
+                if self.left[kind] > 0:
+                    self.left[kind] -= 1
+                    self.gathered[i][kind] += 1
+                    break
+
+    def apply(self, site):
+        location = site.location
+        for dwarf, hunger, hp, gathered in zip(site.dwarfs, self.hunger, self.hp, self.gathered):
+            dwarf.hunger = hunger / 10
+            dwarf.hp = hp
+            # the trees and rocks worked are the ones nearest to the dwarf
+            for goal, tile, count in zip(('chop', 'mine'), (location.tree, location.rock), gathered):
+                if not count:
+                    continue
+                for y, x in location.tile_index.nearest(tile, dwarf.y_coord, dwarf.x_coord, count):
+                    location.set_tile(y, x, location.empty)
+                item, amount = tile_type(tile).yields
+                dwarf.eq[item] += amount * count
+                dwarf.goals_done[goal] = dwarf.goals_done.get(goal, 0) + count
+            dwarf.path = []
+            dwarf.steps = []
+            dwarf.task = None
+        site.food.amount = self.food
+        # what the dwarfs were doing was done in the totals
+        cursor = site.cursor
+        if cursor.goal_designation is not None:
+            location.designations.release(cursor.goal_designation, cursor.goal_y_coord, cursor.goal_x_coord)
+        cursor.goal = None
+        cursor.goal_designation = None
+        cursor.goal_building = None
@@ -0,0 +1,125 @@
+import heapq
+
+# side of a square bucket of the index
+BUCKET_SIZE = 8
+
+
+class TileIndex(object):
+    # positions of chosen tile types bucketed into a coarse grid, answers nearest and
+    # within radius queries by looking only at buckets around the asked position
+
+    def __init__(self, indexed_tiles, height, width, bucket_size=BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self.buckets_y = (height + bucket_size - 1) // bucket_size
+        self.buckets_x = (width + bucket_size - 1) // bucket_size
+        # tile -> {(bucket y, bucket x): set of (y, x)}
+        self.buckets = {tile: {} for tile in indexed_tiles}
+        self.counts = {tile: 0 for tile in indexed_tiles}
+        # smallest and biggest bucket y and x ever used, nearest searches do not go past them
+        self.extent = None
+
+    def bucket_of(self, y, x):
+        return y // self.bucket_size, x // self.bucket_size
+
+    def move(self, y, x, old_tile, new_tile):
+        if old_tile == new_tile:
+            return
+        bucket = self.bucket_of(y, x)
+        if old_tile in self.buckets:
+            cells = self.buckets[old_tile][bucket]
+            cells.discard((y, x))
+            if not cells:
+                del self.buckets[old_tile][bucket]
+            self.counts[old_tile] -= 1
+        if new_tile in self.buckets:
+            self.buckets[new_tile].setdefault(bucket, set()).add((y, x))
+            self.counts[new_tile] += 1
+            if self.extent is None:
+                self.extent = [bucket[0], bucket[1], bucket[0], bucket[1]]
+            elif not (self.extent[0] <= bucket[0] <= self.extent[2] and self.extent[1] <= bucket[1] <= self.extent[3]):
+                self.extent = [min(self.extent[0], bucket[0]), min(self.extent[1], bucket[1]),
+                               max(self.extent[2], bucket[0]), max(self.extent[3], bucket[1])]
+
+    def add_row(self, tile, y, xs):
+        # many new positions of tile on row y at once, for loading whole maps
+        if not xs:
+            return
+        buckets = self.buckets[tile]
+        by = y // self.bucket_size
+        cells = None
+        current = None
+        for x in xs:
+            bx = x // self.bucket_size
+            if bx != current:
+                current = bx
+                cells = buckets.setdefault((by, bx), set())
+            cells.add((y, x))
+        self.counts[tile] += len(xs)
+        first, last = xs[0] // self.bucket_size, xs[-1] // self.bucket_size
+        if self.extent is None:
+            self.extent = [by, first, by, last]
+        else:
+            self.extent = [min(self.extent[0], by), min(self.extent[1], first),
+                           max(self.extent[2], by), max(self.extent[3], last)]
+
+    def count(self, tile):
+        return self.counts[tile]
+
+    def ring(self, center, radius):
+        # buckets lying exactly radius buckets away from center
+        cy, cx = center
+        for by in range(cy - radius, cy + radius + 1):
+            if by < 0 or by >= self.buckets_y:
+                continue
+            if by in (cy - radius, cy + radius):
+                xs = range(cx - radius, cx + radius + 1)
+            else:
+                xs = (cx - radius, cx + radius)
+            for bx in xs:
+                if 0 <= bx < self.buckets_x:
+                    yield by, bx
+
+    def nearest(self, tile, y, x, k=1, max_distance=None):
+        # up to k positions of tile sorted by walking (manhattan) distance from y, x,
+        # none further than max_distance when it is given
+        buckets = self.buckets[tile]
+        found = []
+        if not buckets:
+            return found
+        center = self.bucket_of(y, x)
+        min_by, min_bx, max_by, max_bx = self.extent
+        max_radius = max(center[0] - min_by, max_by - center[0], center[1] - min_bx, max_bx - center[1])
+        if max_distance is not None:
+            max_radius = min(max_radius, max_distance // self.bucket_size + 1)
+        for radius in range(max_radius + 1):
+            for bucket in self.ring(center, radius):
+                for cell in buckets.get(bucket, ()):
+                    found.append((abs(cell[0] - y) + abs(cell[1] - x), cell))
+            # anything in further rings is at least this far away
+            if len(found) >= k and heapq.nsmallest(k, found)[-1][0] <= radius * self.bucket_size + 1:
+                break
+        found = heapq.nsmallest(k, found)
+        return [cell for distance, cell in found if max_distance is None or distance <= max_distance]
+
+    def within_radius(self, tile, y, x, radius):
+        buckets = self.buckets[tile]
+        min_by, min_bx = self.bucket_of(max(y - radius, 0), max(x - radius, 0))
+        max_by, max_bx = self.bucket_of(y + radius, x + radius)
+        found = []
+        for by in range(min_by, min(max_by, self.buckets_y - 1) + 1):
+            for bx in range(min_bx, min(max_bx, self.buckets_x - 1) + 1):
+                for cell in buckets.get((by, bx), ()):
+                    if abs(cell[0] - y) + abs(cell[1] - x) <= radius:
+                        found.append(cell)
+        return found
+
+    def within_rect(self, tile, top, left, bottom, right):
+        # generator, bucket contents are copied so tiles may change between steps
+        buckets = self.buckets[tile]
+        min_by, min_bx = self.bucket_of(top, left)
+        max_by, max_bx = self.bucket_of(bottom, right)
+        for by in range(min_by, max_by + 1):
+            for bx in range(min_bx, max_bx + 1):
+                for cell in sorted(buckets.get((by, bx), ())):
+                    if top <= cell[0] <= bottom and left <= cell[1] <= right:
+                        yield cell
@@ -0,0 +1,238 @@
+import argparse
+import json
+import selectors
+import socket
+import threading
+from collections import deque
+
+# every this many ticks a full frame is sent, so late or lagging viewers can catch up
+KEYFRAME_INTERVAL = 50
+# frames kept for viewers that are a bit behind, always more than one keyframe interval
+FRAME_HISTORY = 2 * KEYFRAME_INTERVAL
+# bytes waiting for one viewer, a viewer over it skips frames until the next keyframe
+MAX_CLIENT_BACKLOG = 256 * 1024
+
+
+class SpectatorServer(object):
+    # lets others watch the game over a local TCP port, frames are newline separated JSON,
+    # a keyframe with every tile of the view and deltas with only the changed tiles after it,
+    # the game thread builds each frame once no matter how many watch, sending is done by a
+    # thread of its own
+
+    def __init__(self, location, host='127.0.0.1', port=0):
+        self.location = location
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        # (sequence number, is keyframe, encoded frame)
+        self.frames = deque(maxlen=FRAME_HISTORY)
+        self.last_keyframe = None
+        self.sequence = 0
+        self.lock = threading.Lock()
+        # tiles changed since the last frame
+        self.dirty = set()
+        self.last_view = None
+        location.tile_listeners.append(self.on_tile_change)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        # writing a byte here wakes the sending thread up when there is a new frame
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ, None)
+        self.clients = {}
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def on_tile_change(self, y, x, tile):
+        self.dirty.add((y, x))
+
+    def publish(self, world, location, dwarf, food, cursor):
+        # called by the game once per tick
+        view = (location.view_top, location.view_left, location.view_height, location.view_width)
+        self.sequence += 1
+        frame = {'seq': self.sequence,
+                 'time': round(world.time_of_the_day, 3),
+                 'entities': [[thing.representation, thing.y_coord, thing.x_coord]
+                              for thing in (food, dwarf, cursor)]}
+        keyframe = view != self.last_view or self.sequence % KEYFRAME_INTERVAL == 1
+        if keyframe:
+            top, left, height, width = view
+            frame['type'] = 'key'
+            frame['top'], frame['left'] = top, left
+            frame['rows'] = [''.join(location.get_tile(y, x) for x in range(left, left + width))
+                             for y in range(top, top + height)]
+        else:
+            frame['type'] = 'delta'
+            frame['tiles'] = [[y, x, location.get_tile(y, x)] for y, x in self.dirty]
+        self.dirty.clear()
+        self.last_view = view
+        data = (json.dumps(frame, ensure_ascii=False) + '\n').encode('utf-8')
+        with self.lock:
+            self.frames.append((self.sequence, keyframe, data))
+            if keyframe:
+                self.last_keyframe = self.sequence
+        try:
+            self.wake_writer.send(b'.')
+        except (BlockingIOError, OSError):
+            pass
+
+    def run(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=0.5):
+                if key.fileobj is self.listener:
+                    self.accept()
+                elif key.fileobj is self.wake_reader:
+                    try:
+                        while self.wake_reader.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                elif events & selectors.EVENT_READ:
+                    # viewers have nothing to say, a read only tells that one went away
+                    try:
+                        if not key.fileobj.recv(4096):
+                            self.drop(key.fileobj)
+                            continue
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except OSError:
+                        self.drop(key.fileobj)
+                        continue
+            self.fill_backlogs()
+            self.send_backlogs()
+
+    def accept(self):
+        try:
+            connection, _ = self.listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        connection.setblocking(False)
+        # a new viewer starts from the last keyframe
+        self.clients[connection] = {'next': None, 'backlog': bytearray()}
+        self.selector.register(connection, selectors.EVENT_READ, None)
+
+    def drop(self, connection):
+        self.clients.pop(connection, None)
+        try:
+            self.selector.unregister(connection)
+        except (KeyError, ValueError):
+            pass
+        connection.close()
+
+    def fill_backlogs(self):
+        with self.lock:
+            frames = list(self.frames)
+            last_keyframe = self.last_keyframe
+        if not frames or last_keyframe is None:
+            return
+        oldest = frames[0][0]
+        for client in self.clients.values():
+            if client['next'] is None or client['next'] < oldest:
+                # new viewer, or so far behind the frames it needs are gone, skip to the keyframe
+                client['next'] = last_keyframe
+            for sequence, _, data in frames[client['next'] - oldest:]:
+                if len(client['backlog']) + len(data) > MAX_CLIENT_BACKLOG:
+                    break
+                client['backlog'] += data
+                client['next'] = sequence + 1
+
+    def send_backlogs(self):
+        for connection, client in list(self.clients.items()):
+            if not client['backlog']:
+                continue
+            try:
+                sent = connection.send(client['backlog'])
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                self.drop(connection)
+                continue
+            del client['backlog'][:sent]
+
+    def close(self):
+        self.running = False
+        try:
+            self.wake_writer.send(b'.')
+        except OSError:
+            pass
+        self.thread.join(timeout=2)
+        for connection in list(self.clients):
+            self.drop(connection)
+        self.selector.close()
+        self.listener.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+
+
+class SpectatorClient(object):
+    # stand-in viewer, keeps its own copy of the view built from the frames it gets
+
+    def __init__(self, host='127.0.0.1', port=0, timeout=5):
+        self.connection = socket.create_connection((host, port), timeout=timeout)
+        self.reader = self.connection.makefile('rb')
+        self.rows = []
+        self.top = 0
+        self.left = 0
+        self.entities = []
+        self.time = None
+        self.last_sequence = None
+        self.frames = 0
+        self.missed = 0
+
+    def receive(self):
+        line = self.reader.readline()
+        if not line:
+            return None
+        frame = json.loads(line.decode('utf-8'))
+        if self.last_sequence is not None and frame['seq'] != self.last_sequence + 1:
+            # the server skipped frames because this viewer was too slow
+            self.missed += frame['seq'] - self.last_sequence - 1
+        if frame['type'] == 'key':
+            self.top = frame['top']
+            self.left = frame['left']
+            self.rows = [list(row) for row in frame['rows']]
+        else:
+            for y, x, tile in frame['tiles']:
+                if 0 <= y - self.top < len(self.rows) and 0 <= x - self.left < len(self.rows[0]):
+                    self.rows[y - self.top][x - self.left] = tile
+        self.last_sequence = frame['seq']
+        self.entities = frame['entities']
+        self.time = frame['time']
+        self.frames += 1
+        return frame
+
+    def render(self):
+        rows = [row[:] for row in self.rows]
+        for representation, y, x in self.entities:
+            if 0 <= y - self.top < len(rows) and 0 <= x - self.left < len(rows[0]):
+                rows[y - self.top][x - self.left] = representation
+        return '\n'.join(' '.join(row) for row in rows)
+
+    def close(self):
+        self.reader.close()
+        self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Watch a running Karel Fortress')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args()
+    client = SpectatorClient(args.host, args.port, timeout=None)
+    try:
+        while client.receive() is not None:
+            print('\033[H\033[J' + client.render())
+            print('time:', int(client.time), '| frames:', client.frames, '| missed:', client.missed)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == '__main__':
+    main()
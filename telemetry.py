@@ -0,0 +1,121 @@
+import json
+import struct
+import sys
+from array import array
+
+# rows kept by every level of the telemetry
+TELEMETRY_CAPACITY = 4096
+# each coarser level keeps the mean of this many rows of the level below it
+DOWNSAMPLE_FACTORS = (64, 64)
+# start of a columnar telemetry file, followed by the header length and a JSON header
+COLUMNS_MAGIC = b'KFTM'
+
+
+class TelemetryLevel(object):
+    # ring of rows with one preallocated array per metric, the oldest rows are overwritten
+
+    def __init__(self, names, capacity, factor):
+        self.names = names
+        self.capacity = capacity
+        # ticks one row of this level stands for
+        self.factor = factor
+        self.ticks = array('q', bytes(8 * capacity))
+        self.columns = [array('d', bytes(8 * capacity)) for _ in names]
+        self.written = 0
+
+    def append(self, tick, values):
+        i = self.written % self.capacity
+        self.ticks[i] = tick
+        for column, value in zip(self.columns, values):
+            column[i] = value
+        self.written += 1
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def order(self):
+        # positions of the kept rows from the oldest
+        start = self.written - len(self)
+        return [i % self.capacity for i in range(start, self.written)]
+
+    def means(self, count):
+        # mean of every metric over the last count rows
+        start = (self.written - count) % self.capacity
+        end = start + count
+        if end <= self.capacity:
+            return [sum(column[start:end]) / count for column in self.columns]
+        end -= self.capacity
+        return [(sum(column[start:]) + sum(column[:end])) / count for column in self.columns]
+
+
+class Telemetry(object):
+    # per tick metrics of the fortress in fixed size rings, every level is coarser than the one
+    # before it, so a long game keeps its whole history at a lower resolution
+
+    def __init__(self, names, capacity=TELEMETRY_CAPACITY, factors=DOWNSAMPLE_FACTORS):
+        self.names = list(names)
+        self.levels = [TelemetryLevel(self.names, capacity, 1)]
+        for factor in factors:
+            if factor > capacity:
+                raise ValueError('a level can not average more rows than the one below keeps')
+            self.levels.append(TelemetryLevel(self.names, capacity, self.levels[-1].factor * factor))
+        self.factors = factors
+
+    def record(self, tick, values):
+        # values in the order of names, called once a tick
+        level = self.levels[0]
+        level.append(tick, values)
+        for factor, coarser in zip(self.factors, self.levels[1:]):
+            if level.written % factor:
+                break
+            coarser.append(tick, level.means(factor))
+            level = coarser
+
+    def rows(self, level=0):
+        kept = self.levels[level]
+        for i in kept.order():
+            yield [kept.ticks[i]] + [column[i] for column in kept.columns]
+
+    def export_csv(self, path, level=0):
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(','.join(['tick'] + self.names) + '\n')
+            for row in self.rows(level):
+                file.write(','.join([str(row[0])] + ['{:g}'.format(value) for value in row[1:]]) + '\n')
+
+    def export_columns(self, path, level=0):
+        # header, then every column as little-endian numbers, ticks first, one after another
+        kept = self.levels[level]
+        order = kept.order()
+        header = json.dumps({'columns': ['tick'] + self.names, 'rows': len(order), 'ticks_per_row': kept.factor,
+                             'types': ['int64'] + ['float64'] * len(self.names)}).encode('utf-8')
+        with open(path, 'wb') as file:
+            file.write(COLUMNS_MAGIC)
+            file.write(struct.pack('<I', len(header)))
+            file.write(header)
+            for source in [kept.ticks] + kept.columns:
+                column = array(source.typecode, (source[i] for i in order))
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                file.write(column.tobytes())
+
+    def export(self, path, level=0):
+        if path.endswith('.csv'):
+            self.export_csv(path, level)
+        else:
+            self.export_columns(path, level)
+
+
+def read_columns(path):
+    # {name: list of values} of a file written by export_columns
+    with open(path, 'rb') as file:
+        if file.read(4) != COLUMNS_MAGIC:
+            raise ValueError('{} is not a telemetry file'.format(path))
+        header = json.loads(file.read(struct.unpack('<I', file.read(4))[0]).decode('utf-8'))
+        columns = {}
+        for name, kind in zip(header['columns'], header['types']):
+            column = array('q' if kind == 'int64' else 'd')
+            column.frombytes(file.read(8 * header['rows']))
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = list(column)
+    return columns
@@ -0,0 +1,55 @@
+import os
+import select
+import sys
+
+from key_events import KeyEventBuffer
+
+# escape sequences of the special keys, translated to the names tkinter gives them
+ESCAPE_SEQUENCES = {'\x1b[A': 'Up', '\x1b[B': 'Down', '\x1b[C': 'Right', '\x1b[D': 'Left',
+                    '\x1bOA': 'Up', '\x1bOB': 'Down', '\x1bOC': 'Right', '\x1bOD': 'Left'}
+SPECIAL_CHARACTERS = {'\r': 'Return', '\n': 'Return', '\x7f': 'BackSpace', '\t': 'Tab', ' ': 'space'}
+
+
+class TerminalInput(object):
+    # reads keys straight from the terminal, works the same way as KeyEventCanvas without
+    # opening any window, so it starts fast and also works over ssh or on a headless server
+
+    def __init__(self, key_handler_function):
+        import termios
+        import tty
+        self.key_handler_function = key_handler_function
+        # keys pressed since the game last took them
+        self.keys = KeyEventBuffer()
+        self.fd = sys.stdin.fileno()
+        self.old_settings = termios.tcgetattr(self.fd)
+        # keys come one by one without enter and are not echoed, output still works normally
+        tty.setcbreak(self.fd)
+        self.pending = ''
+
+    def update(self):
+        while select.select([self.fd], [], [], 0)[0]:
+            data = os.read(self.fd, 1024)
+            if not data:
+                break
+            self.pending += data.decode('utf-8', 'ignore')
+        while self.pending:
+            key, self.pending = self.split_key(self.pending)
+            if key is None:
+                break
+            self.key_handler_function(self, key)
+
+    def split_key(self, text):
+        if text[0] != '\x1b':
+            return SPECIAL_CHARACTERS.get(text[0], text[0]), text[1:]
+        for sequence, key in ESCAPE_SEQUENCES.items():
+            if text.startswith(sequence):
+                return key, text[len(sequence):]
+        if 1 < len(text) < 3 and any(sequence.startswith(text) for sequence in ESCAPE_SEQUENCES):
+            # rest of the sequence has not arrived yet, an escape with nothing after it in the
+            # same read is the escape key itself
+            return None, text
+        return 'Escape', text[1:]
+
+    def close(self):
+        import termios
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self.old_settings)
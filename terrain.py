@@ -0,0 +1,59 @@
+import random
+
+# side of a square chunk of lazily generated terrain
+CHUNK_SIZE = 32
+# loaded chunks nobody changed, the least recently used ones over this are forgotten
+MAX_LOADED_CHUNKS = 512
+# columns between two random points of the mountain surface
+SURFACE_STEP = 16
+# how far up or down from the middle the mountain surface wanders
+SURFACE_VARIATION = 6
+
+
+class TerrainGenerator(object):
+    # the same seed and chunk coordinates always give the same chunk, so a chunk nobody
+    # changed can be thrown away and made again when it is needed
+
+    def __init__(self, seed, middle_y, empty, rock, tree, trees_ratio, chunk_size=CHUNK_SIZE):
+        self.seed = seed
+        self.middle_y = middle_y
+        self.empty = empty
+        self.rock = rock
+        self.tree = tree
+        self.trees_ratio = trees_ratio
+        self.chunk_size = chunk_size
+
+    def surface_point(self, i):
+        # seeding with a string is stable between runs, unlike hash()
+        rng = random.Random('{}:surface:{}'.format(self.seed, i))
+        return rng.randint(-SURFACE_VARIATION, SURFACE_VARIATION)
+
+    def surface(self, first_x, count):
+        # y of the mountain top for count columns from first_x, straight lines between random points
+        heights = []
+        points = {}
+        for x in range(first_x, first_x + count):
+            i, offset = divmod(x, SURFACE_STEP)
+            for point in (i, i + 1):
+                if point not in points:
+                    points[point] = self.surface_point(point)
+            heights.append(self.middle_y + points[i] + (points[i + 1] - points[i]) * offset // SURFACE_STEP)
+        return heights
+
+    def chunk(self, cy, cx):
+        top = cy * self.chunk_size
+        left = cx * self.chunk_size
+        surface = self.surface(left, self.chunk_size)
+        rng = random.Random('{}:{}:{}'.format(self.seed, cy, cx))
+        rows = []
+        for y in range(top, top + self.chunk_size):
+            row = []
+            for height in surface:
+                if y >= height:
+                    row.append(self.rock)
+                elif rng.randrange(self.trees_ratio) == 0:
+                    row.append(self.tree)
+                else:
+                    row.append(self.empty)
+            rows.append(row)
+        return rows
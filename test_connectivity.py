@@ -0,0 +1,49 @@
+import random
+
+import main
+from connectivity import ConnectivityRegions
+from pathfinding import bfs_tree
+
+
+def make_location(width, height):
+    world = main.World('test', width, height)
+    location = main.Grid(world, 'test')
+    location.regions = ConnectivityRegions(location)
+    location.regions.rebuild()
+    return location
+
+
+def bfs_reachable(location, start, goal):
+    if not location.is_walkable(*start):
+        return False
+    distances, _ = bfs_tree(location.is_walkable, start, (0, 0, location.height - 1, location.width - 1))
+    return goal in distances
+
+
+def test_reopened_cell_sealed_off_is_not_reachable():
+    location = make_location(10, 5)
+    location.set_tile(2, 5, location.rock)
+    for y, x in [(1, 5), (3, 5), (2, 4), (2, 6)]:
+        location.set_tile(y, x, location.wall)
+    location.set_tile(2, 5, location.empty)
+    assert not location.regions.reachable((0, 0), [(2, 5)])
+
+
+def test_random_edits_match_bfs():
+    rng = random.Random(38)
+    for _ in range(40):
+        width, height = rng.randint(3, 12), rng.randint(3, 12)
+        location = make_location(width, height)
+        cells = [(y, x) for y in range(height) for x in range(width)]
+        for y, x in cells:
+            if rng.random() < 0.3:
+                location.set_tile(y, x, location.rock)
+        location.regions.rebuild()
+        for _ in range(60):
+            y, x = rng.choice(cells)
+            tile = location.empty if location.get_tile(y, x) != location.empty else rng.choice(
+                [location.rock, location.wall])
+            location.set_tile(y, x, tile)
+            start, goal = rng.choice(cells), rng.choice(cells)
+            assert location.regions.reachable(start, [goal]) == bfs_reachable(location, start, goal), \
+                (start, goal)
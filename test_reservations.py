@@ -0,0 +1,66 @@
+import random
+
+import main
+from pathfinding import HierarchicalPathfinder, PathCache
+
+
+# the game has one dwarf per site, these put several on one location so they plan around each other
+
+
+def make_location(width, height):
+    world = main.World('test', width, height)
+    location = main.Grid(world, 'test')
+    location.pathfinder = HierarchicalPathfinder(location)
+    location.path_cache = PathCache(location, location.pathfinder)
+    return world, location
+
+
+def send(location, y, x):
+    cursor = main.Cursor(location)
+    cursor.goal = 'go'
+    cursor.goal_y_coord, cursor.goal_x_coord = y, x
+    return cursor
+
+
+def test_walks_around_an_arrived_dwarf():
+    # one row wide corridor, the first dwarf stops in the middle of it and stays there
+    world, location = make_location(20, 3)
+    for x in range(20):
+        location.set_tile(0, x, location.rock)
+        location.set_tile(2, x, location.rock)
+    stopped = main.Dwarf(location, 'stopped', 1, 8)
+    walker = main.Dwarf(location, 'walker', 1, 0)
+    stopped.y_coord, stopped.x_coord = 1, 8
+    walker.y_coord, walker.x_coord = 1, 0
+    stopped_cursor = send(location, 1, 10)
+    walker_cursor = send(location, 1, 19)
+    for _ in range(60):
+        stopped.dwarf_move(world, location, stopped_cursor)
+        walker.dwarf_move(world, location, walker_cursor)
+        assert (walker.y_coord, walker.x_coord) != (stopped.y_coord, stopped.x_coord)
+        world.world_tick()
+    assert (stopped.y_coord, stopped.x_coord) == (1, 10)
+    assert walker.x_coord < 10
+
+
+def test_dwarfs_never_share_a_tile():
+    rng = random.Random(36)
+    world, location = make_location(40, 30)
+    # a wall with a few gaps makes them cross each other
+    for y in range(30):
+        if y % 7:
+            location.set_tile(y, 20, location.rock)
+    cells = [(y, x) for y in range(30) for x in range(18)]
+    dwarfs = []
+    for y, x in rng.sample(cells, 40):
+        dwarf = main.Dwarf(location, 'dwarf', y, x)
+        dwarf.y_coord, dwarf.x_coord = y, x
+        goal = (rng.randrange(30), rng.randrange(22, 40))
+        dwarfs.append((dwarf, send(location, *goal)))
+    for _ in range(150):
+        for dwarf, cursor in dwarfs:
+            dwarf.dwarf_move(world, location, cursor)
+        standing = [(dwarf.y_coord, dwarf.x_coord) for dwarf, _ in dwarfs]
+        assert len(set(standing)) == len(standing)
+        world.world_tick()
+    assert all(dwarf.x_coord > 20 for dwarf, _ in dwarfs)
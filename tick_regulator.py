@@ -0,0 +1,77 @@
+import time
+from collections import deque
+
+# ticks the game may fall behind before the lost time is given up instead of caught up
+MAX_CATCH_UP_TICKS = 5
+# frames drawn per second at most while catching up or in turbo
+MAX_FRAMES_PER_SECOND = 30
+# seconds over which the achieved tick rate is measured
+RATE_WINDOW = 1.0
+
+
+class TickRegulator(object):
+    # keeps ticks period seconds apart on a monotonic clock, the time the tick itself took
+    # is taken off the sleep so the rate does not drift with load, period 0 runs uncapped
+
+    def __init__(self, period, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.period = period
+        # when the running tick should be over
+        self.deadline = clock() + period
+        self.last_frame = None
+        # ticks done during the last RATE_WINDOW seconds, counted from rate_since at most
+        self.tick_times = deque()
+        self.rate_since = clock()
+        self.skipped_ticks = 0
+        self.skipped_frames = 0
+
+    def set_period(self, period):
+        self.period = period
+        self.deadline = self.clock() + period
+        self.tick_times.clear()
+        self.rate_since = self.clock()
+
+    def target_rate(self):
+        return 1 / self.period if self.period else None
+
+    def achieved_rate(self):
+        now = self.clock()
+        while self.tick_times and now - self.tick_times[0] > RATE_WINDOW:
+            self.tick_times.popleft()
+        measured = min(now - self.rate_since, RATE_WINDOW)
+        if measured <= 0:
+            return 0.0
+        return len(self.tick_times) / measured
+
+    def should_draw(self):
+        # every tick is drawn while on time, when behind or in turbo only a few frames a
+        # second are, so the time goes to catching up
+        now = self.clock()
+        if (self.period and now < self.deadline) or self.last_frame is None or \
+                now - self.last_frame >= 1 / MAX_FRAMES_PER_SECOND:
+            self.last_frame = now
+            return True
+        self.skipped_frames += 1
+        return False
+
+    def wait(self):
+        # called once at the end of every tick
+        now = self.clock()
+        self.tick_times.append(now)
+        while now - self.tick_times[0] > RATE_WINDOW:
+            self.tick_times.popleft()
+        if not self.period:
+            self.deadline = now
+            return
+        delay = self.deadline - now
+        if delay > 0:
+            self.sleep(delay)
+            self.deadline += self.period
+        elif -delay > MAX_CATCH_UP_TICKS * self.period:
+            # too far behind, catching up would run the game at full speed for a long while
+            self.skipped_ticks += int(-delay / self.period)
+            self.deadline = now + self.period
+        else:
+            # behind, the next tick starts right away
+            self.deadline += self.period
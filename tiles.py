@@ -0,0 +1,69 @@
+class TileType(object):
+    # what one kind of tile is and what dwarfs can do with it, yields is (equipment, amount) got
+    # by chopping or mining it, color is its pixel on the minimap
+
+    def __init__(self, glyph, name, description=None, walkable=False, opaque=False, minable=False,
+                 choppable=False, buildable_on=False, yields=None, color='#000000'):
+        self.glyph = glyph
+        self.name = name
+        self.color = color
+        # shown on the hud when the cursor points at it
+        self.description = description
+        self.walkable = walkable
+        self.opaque = opaque
+        self.minable = minable
+        self.choppable = choppable
+        self.buildable_on = buildable_on
+        self.yields = yields
+
+
+TILE_TYPES = [TileType('.', 'ground', walkable=True, buildable_on=True, color='#8a7a5c'),
+              TileType('■', 'rock', 'rocky ■', opaque=True, minable=True, yields=('rock_chunks', 10),
+                       color='#5a5a5a'),
+              TileType('♠', 'tree', 'green ♠', opaque=True, choppable=True, yields=('wood', 15), color='#2e7d32'),
+              TileType('░', 'wall', 'wooden ░', opaque=True, color='#a0522d'),
+              TileType('B', 'bed', walkable=True, color='#d4b483'),
+              # young tree, grows into a real one when the environment is switched on
+              TileType(',', 'sapling', walkable=True, color='#7cb342'),
+              TileType('~', 'water', color='#1e88e5')]
+# glyph -> TileType
+TILES = {tile.glyph: tile for tile in TILE_TYPES}
+# stands in for glyphs that are not in the registry
+UNKNOWN_TILE = TileType('?', 'unknown')
+
+
+def tile_type(glyph):
+    return TILES.get(glyph, UNKNOWN_TILE)
+
+
+def glyphs_where(flag):
+    # glyphs of the tile types that have flag set
+    return [tile.glyph for tile in TILE_TYPES if getattr(tile, flag)]
+
+
+class PassabilityLayer(object):
+    # bit packed rows of a finite location, bit x of rows[y] is set where a dwarf can walk, checking
+    # a cell is a shift and a mask instead of looking its glyph up, kept up to date by the location
+
+    def __init__(self, height, width, walkable_tiles, filled_with):
+        self.height = height
+        self.width = width
+        self.walkable_tiles = frozenset(walkable_tiles)
+        # glyph -> '1' or '0', turns a whole row of text into the digits of its mask
+        self.digits = {ord(glyph): '1' for glyph in self.walkable_tiles}
+        self.rows = [(1 << width) - 1 if filled_with in self.walkable_tiles else 0] * height
+
+    def is_walkable(self, y, x):
+        # callers keep inside the location like with get_tile, past the right edge nothing is walkable
+        return self.rows[y] >> x & 1 == 1
+
+    def set(self, y, x, tile):
+        if tile in self.walkable_tiles:
+            self.rows[y] |= 1 << x
+        else:
+            self.rows[y] &= ~(1 << x)
+
+    def load_row(self, y, text):
+        # the first tile is the lowest bit, so the digits are read from the end of the row
+        digits = ''.join(self.digits.get(ord(tile), '0') for tile in reversed(text))
+        self.rows[y] = int(digits, 2) if digits else 0
@@ -0,0 +1,99 @@
+# ticks between two decisions of a dwarf nothing happened to, dwarfs are spread over them
+DECISION_CADENCE = 10
+# tiles at which a tree or a rock counts half as attractive as one right next to the dwarf
+NEARBY_DISTANCE = 10
+# trees and rocks further away than this are not looked for, they would hardly add to the score
+SEARCH_DISTANCE = 3 * NEARBY_DISTANCE
+
+ACTIONS = ['eat', 'sleep', 'chop', 'mine', 'build', 'idle']
+FEATURES = ['hunger', 'starving', 'night', 'tree nearby', 'rock nearby', 'can build', 'hurt', 'always']
+# feature -> score it adds to every action, in the order of ACTIONS
+WEIGHTS = {'hunger': [0.6, 0, 0, 0, 0, 0],
+           'starving': [2.0, 0, 0, 0, 0, 0],
+           'night': [0, 1.5, -1.0, -1.0, -1.0, 0],
+           'tree nearby': [0, 0, 0.8, 0, 0, 0],
+           'rock nearby': [0, 0, 0, 0.6, 0, 0],
+           'can build': [0, 0, 0, 0, 1.2, 0],
+           'hurt': [0.3, 0.5, 0, 0, 0, 0],
+           'always': [0, 0, 0, 0, 0, 0.2]}
+
+
+class UtilityBrain(object):
+    # picks what idle dwarfs do by scoring every action from their needs and what is around them,
+    # the needs of all dwarfs deciding in a tick go into one matrix multiplied by the weights,
+    # a dwarf decides again every DECISION_CADENCE ticks or right after trigger() was called for it
+
+    def __init__(self, location, cadence=DECISION_CADENCE, weights=WEIGHTS):
+        # NumPy is only needed when the dwarfs decide on their own
+        import numpy
+        self.numpy = numpy
+        self.location = location
+        self.cadence = cadence
+        self.weights = numpy.array([weights[feature] for feature in FEATURES], dtype=float)
+        self.dwarfs = []
+        # dwarf -> its place in dwarfs, which sets the tick it decides at
+        self.slots = {}
+        self.triggered = set()
+        # dwarf -> (action, target tile or None) decided last
+        self.decisions = {}
+
+    def add(self, dwarf):
+        self.slots[dwarf] = len(self.dwarfs)
+        self.dwarfs.append(dwarf)
+        self.triggered.add(dwarf)
+
+    def trigger(self, dwarf):
+        self.triggered.add(dwarf)
+
+    def trigger_all(self):
+        self.triggered.update(self.dwarfs)
+
+    def due(self, tick):
+        # dwarfs whose turn it is plus the triggered ones
+        deciding = self.dwarfs[tick % self.cadence::self.cadence]
+        if self.triggered:
+            deciding = sorted(set(deciding) | self.triggered, key=self.slots.get)
+            self.triggered.clear()
+        return deciding
+
+    def features(self, world, dwarfs, wall_jobs):
+        numpy = self.numpy
+        count = len(dwarfs)
+        hunger = numpy.fromiter((dwarf.hunger for dwarf in dwarfs), dtype=float, count=count)
+        hp = numpy.fromiter((dwarf.hp for dwarf in dwarfs), dtype=float, count=count)
+        wood = numpy.fromiter((dwarf.eq['wood'] for dwarf in dwarfs), dtype=float, count=count)
+        targets = {}
+        distances = numpy.full((count, 2), numpy.inf)
+        index = self.location.tile_index
+        for i, dwarf in enumerate(dwarfs):
+            y, x = dwarf.y_coord, dwarf.x_coord
+            for j, tile in enumerate((self.location.tree, self.location.rock)):
+                nearest = index.nearest(tile, y, x, max_distance=SEARCH_DISTANCE)
+                if nearest:
+                    targets[(i, tile)] = nearest[0]
+                    distances[i, j] = abs(nearest[0][0] - y) + abs(nearest[0][1] - x)
+        need = numpy.clip((100 - hunger) / 100, 0, 1)
+        matrix = numpy.empty((count, len(FEATURES)))
+        matrix[:, 0] = need
+        matrix[:, 1] = need ** 3
+        matrix[:, 2] = 1.0 if world.is_it_night_or_day == 'night' else 0.0
+        matrix[:, 3:5] = NEARBY_DISTANCE / (NEARBY_DISTANCE + distances)
+        matrix[:, 5] = (wood >= 5) & wall_jobs
+        matrix[:, 6] = numpy.clip((30 - hp) / 30, 0, 1)
+        matrix[:, 7] = 1.0
+        return matrix, targets
+
+    def decide(self, world, tick, wall_jobs=False):
+        # [(dwarf, action, target tile or None)] for the dwarfs deciding in this tick
+        dwarfs = self.due(tick)
+        if not dwarfs:
+            return []
+        matrix, targets = self.features(world, dwarfs, wall_jobs)
+        best = (matrix @ self.weights).argmax(axis=1)
+        decisions = []
+        for i, (dwarf, action) in enumerate(zip(dwarfs, best.tolist())):
+            action = ACTIONS[action]
+            target = targets.get((i, {'chop': self.location.tree, 'mine': self.location.rock}.get(action)))
+            self.decisions[dwarf] = (action, target)
+            decisions.append((dwarf, action, target))
+        return decisions